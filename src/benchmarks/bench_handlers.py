@@ -0,0 +1,313 @@
+# src/benchmarks/bench_handlers.py
+
+import sys
+import json
+import time
+import uuid
+import logging
+import platform
+import argparse
+import statistics
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# The server modules import each other by name, the client package lives next to them
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'server'))
+
+from server import MessageUServer  # noqa: E402
+from user import User  # noqa: E402
+from message import Message, MessageType  # noqa: E402
+from client import protocol  # noqa: E402
+
+PUBLIC_KEY = b'\x01' * 160
+DEFAULT_OUTPUT = Path(__file__).parent / 'results.json'
+
+
+class FakeSocket:
+    """In-memory socket: recv() reads a preloaded request, sent data is recorded"""
+
+    def __init__(self, incoming: bytes = b''):
+        self.incoming = memoryview(incoming)
+        self.position = 0
+        self.sent: List[bytes] = []  # Chunks are kept as passed, so recording does not copy them
+
+    def load(self, incoming: bytes):
+        """Replace the data returned by recv() and clear the recorded data"""
+        self.incoming = memoryview(incoming)
+        self.position = 0
+        self.sent = []
+
+    def recv(self, size: int) -> bytes:
+        chunk = self.incoming[self.position:self.position + size]
+        self.position += len(chunk)
+        return bytes(chunk)
+
+    def send(self, data) -> int:
+        self.sent.append(data)
+        return len(data)
+
+    def sendall(self, data):
+        self.sent.append(data)
+
+    def sent_bytes(self) -> bytes:
+        return b''.join(self.sent)
+
+    def response_code(self) -> int:
+        """Code of the first response sent, 0 if nothing was sent"""
+        data = self.sent_bytes()
+        if len(data) < protocol.RESPONSE_HEADER.size:
+            return 0
+        return protocol.RESPONSE_HEADER.unpack_from(data)[1]
+
+    def close(self):
+        pass
+
+
+class Scenario:
+    def __init__(self, name: str, setup: Callable[[MessageUServer], dict],
+                 request: Callable[[dict, int], bytes], expected: int, iterations: int,
+                 prepare: Optional[Callable[[MessageUServer, dict], None]] = None):
+        """
+        One benchmarked request against a server in a given state
+        Args:
+            name (str): Scenario name, the key of its result
+            setup (callable): Fills a new server and returns the state the request builders use
+            request (callable): Returns the framed request of an iteration
+            expected (int): Response code of a successful request
+            iterations (int): Number of timed requests
+            prepare (callable, optional): Restores the server state before each iteration, not timed
+        """
+        self.name = name
+        self.setup = setup
+        self.request = request
+        self.expected = expected
+        self.iterations = iterations
+        self.prepare = prepare
+
+
+def new_server() -> MessageUServer:
+    """Server without listening socket, cluster, slow request traces or traffic capture"""
+    server = MessageUServer()
+    server.cluster = None
+    server.config.slow_request_ms = 0
+    if server.capture is not None:
+        server.capture.close()
+        server.capture = None
+    return server
+
+
+def add_users(server: MessageUServer, count: int) -> List[bytes]:
+    """Register count users directly in the server's registry, returns their IDs"""
+    ids = []
+    for i in range(count):
+        client_id = uuid.uuid4().bytes
+        server.clients[client_id] = User(client_id, f"user{i}", PUBLIC_KEY)
+        ids.append(client_id)
+    return ids
+
+
+def add_messages(server: MessageUServer, to_client: bytes, from_client: bytes, count: int, content: bytes):
+    """Queue count messages for a client"""
+    server.messages.extend(Message(server.new_message_id(), to_client, from_client, MessageType.SEND_TEXT_MESSAGE,
+                                   content) for _ in range(count))
+
+
+def registration(users: int, iterations: int) -> Scenario:
+    """Register a new user with an existing registry of the given size"""
+    def setup(server):
+        add_users(server, users)
+        return {}
+
+    def request(state, i):
+        return protocol.register(f"new-user{i}", PUBLIC_KEY).encode(b'\x00' * 16)
+
+    return Scenario(f"register_{users}_users", setup, request, 2100, iterations)
+
+
+def clients_list(users: int, iterations: int) -> Scenario:
+    """List the clients of a registry of the given size"""
+    def setup(server):
+        return {'client_id': add_users(server, users)[0]}
+
+    def request(state, i):
+        return protocol.clients_list().encode(state['client_id'])
+
+    return Scenario(f"clients_list_{users}_users", setup, request, 2101, iterations)
+
+
+def send_message(queued: int, iterations: int) -> Scenario:
+    """Send a 1 KiB message while the given number of messages is waiting"""
+    def setup(server):
+        sender, recipient = add_users(server, 2)
+        add_messages(server, recipient, sender, queued, b'm' * 1024)
+        return {'sender': sender, 'recipient': recipient}
+
+    def request(state, i):
+        return protocol.send_message(state['recipient'], 3, b'm' * 1024).encode(state['sender'])
+
+    return Scenario(f"send_message_{queued}_queued", setup, request, 2103, iterations)
+
+
+def pending_messages(own: int, others: int, iterations: int) -> Scenario:
+    """Fetch a mailbox of own 1 KiB messages while others are waiting for other clients"""
+    def setup(server):
+        sender, recipient, other = add_users(server, 3)
+        add_messages(server, other, sender, others, b'm' * 1024)
+        return {'sender': sender, 'recipient': recipient}
+
+    def prepare(server, state):
+        add_messages(server, state['recipient'], state['sender'], own, b'm' * 1024)
+
+    def request(state, i):
+        return protocol.pending_messages().encode(state['recipient'])
+
+    return Scenario(f"pending_messages_{own}_own_{others}_others", setup, request, 2104, iterations, prepare)
+
+
+def active_peers(users: int, active: int, iterations: int) -> Scenario:
+    """List the peers active within a minute, out of a registry of the given size"""
+    def setup(server):
+        ids = add_users(server, users)
+        for client_id in ids[:active]:
+            server.presence.touch(client_id)
+        return {'client_id': ids[0]}
+
+    def request(state, i):
+        return protocol.active_peers(60).encode(state['client_id'])
+
+    return Scenario(f"active_peers_{active}_of_{users}_users", setup, request, 2114, iterations)
+
+
+SCENARIOS = [
+    registration(1_000, 200),
+    registration(100_000, 50),
+    registration(1_000_000, 10),
+    clients_list(10_000, 50),
+    clients_list(100_000, 10),
+    send_message(0, 1000),
+    send_message(100_000, 1000),
+    pending_messages(10, 0, 500),
+    pending_messages(10, 100_000, 20),
+    pending_messages(10_000, 0, 20),
+    active_peers(1_000, 100, 500),
+    active_peers(1_000_000, 100, 500),
+]
+
+
+def run_scenario(scenario: Scenario) -> Dict[str, float]:
+    """
+    Run a scenario on a fresh server through handle_request
+
+    Returns:
+        dict: Timing statistics in microseconds
+    """
+    server = new_server()
+    state = scenario.setup(server)
+    fake_socket = FakeSocket()
+    timings = []
+    for i in range(scenario.iterations):
+        if scenario.prepare is not None:
+            scenario.prepare(server, state)
+        fake_socket.load(scenario.request(state, i))
+        start = time.perf_counter()
+        server.handle_request(fake_socket, server.recv_exact(fake_socket, 23), first=True)
+        timings.append(time.perf_counter() - start)
+        if fake_socket.response_code() != scenario.expected:
+            raise RuntimeError(f"{scenario.name}: unexpected response code {fake_socket.response_code()}")
+
+    return {
+        'iterations': scenario.iterations,
+        'median_us': statistics.median(timings) * 1e6,
+        'mean_us': statistics.mean(timings) * 1e6,
+        'min_us': min(timings) * 1e6,
+        'max_us': max(timings) * 1e6,
+    }
+
+
+def git_commit() -> Optional[str]:
+    """Commit of the working tree, None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_all(selected: List[Scenario]) -> dict:
+    results = {}
+    for scenario in selected:
+        results[scenario.name] = run_scenario(scenario)
+        print(f"{scenario.name:45} median {results[scenario.name]['median_us']:12.1f} us")
+    return {
+        'commit': git_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'results': results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """
+    Compare the median timings of two runs
+
+    Args:
+        baseline: Results of the reference run
+        current: Results of the run to check
+        threshold: Allowed slowdown in percent
+
+    Returns:
+        list: Names of the scenarios slower than the threshold allows
+    """
+    print(f"Comparing {current.get('commit')} against baseline {baseline.get('commit')}")
+    regressions = []
+    for name, result in current['results'].items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            print(f"{name:45} (not in baseline)")
+            continue
+        change = (result['median_us'] / reference['median_us'] - 1) * 100
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:45} {reference['median_us']:12.1f} -> {result['median_us']:12.1f} us ({change:+.1f}%){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the MessageU request handlers in-process')
+    parser.add_argument('--filter', default='', help='Only run scenarios whose name contains this text')
+    parser.add_argument('--output', type=Path, default=DEFAULT_OUTPUT, help='File to write the results to')
+    parser.add_argument('--compare', type=Path, help='Baseline results to compare against')
+    parser.add_argument('--current', type=Path, help='Compare these saved results instead of running')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Allowed slowdown in percent')
+    parser.add_argument('--list', action='store_true', help='List the scenarios and exit')
+    args = parser.parse_args()
+
+    if args.list:
+        for scenario in SCENARIOS:
+            print(scenario.name)
+        return
+
+    # Handlers log every request, keep the output to the results
+    logging.disable(logging.CRITICAL)
+
+    if args.current is not None:
+        current = json.loads(args.current.read_text())
+    else:
+        current = run_all([scenario for scenario in SCENARIOS if args.filter in scenario.name])
+        args.output.write_text(json.dumps(current, indent=2))
+        print(f"Results written to {args.output}")
+
+    if args.compare is not None:
+        regressions = compare(json.loads(args.compare.read_text()), current, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} scenarios regressed by more than {args.threshold}%")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+# src/benchmarks/replay.py
+
+import sys
+import json
+import time
+import socket
+import struct
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# The trace format is defined next to the server code
+sys.path.insert(0, str(Path(__file__).parent.parent / 'server'))
+
+from capture import CapturedRequest, read_trace  # noqa: E402
+
+RESPONSE_HEADER = struct.Struct('<BHI')
+# Payload ranges holding client, group or upload IDs assigned by the server when the trace was recorded
+ID_FIELDS = {
+    602: [(0, 16)],
+    603: [(0, 16)],
+    605: [(0, 16)],
+    606: [(0, 4)],
+    607: [(0, 4)],
+    608: [(0, 4)],
+    609: [(16, 32)],
+    611: [(0, 16), (16, 32)],
+    612: [(0, 16), (16, 32)],
+    613: [(0, 16)],
+}
+# Responses assigning a new ID -> size of the ID at the start of their payload
+ASSIGNED_IDS = {2100: 16, 2105: 4, 2110: 16}
+
+
+class IdMap:
+    """IDs assigned when the trace was recorded -> IDs assigned by the server the trace is replayed on"""
+    WAIT_TIMEOUT = 10.0  # Seconds to wait for the request assigning an ID on another connection
+
+    def __init__(self, requests: List[CapturedRequest]):
+        self.mapping: Dict[bytes, bytes] = {}
+        self.failed = set()  # IDs whose assigning request failed in the replay
+        self.cond = threading.Condition()
+        # IDs the replay will learn, a request using one waits until it is known
+        self.pending = {request.response_prefix[:ASSIGNED_IDS[request.response_code]]
+                        for request in requests if request.response_code in ASSIGNED_IDS}
+
+    def learn(self, old: bytes, new: bytes):
+        with self.cond:
+            self.mapping[old] = new
+            self.cond.notify_all()
+
+    def fail(self, old: bytes):
+        """The request assigning an ID failed, the requests using it are not replayed"""
+        with self.cond:
+            self.failed.add(old)
+            self.cond.notify_all()
+
+    def translate(self, old: bytes) -> Optional[bytes]:
+        """
+        Replayed ID for a recorded one, the recorded ID itself if it was not assigned in the trace
+        Returns None if the request assigning it failed or did not run within WAIT_TIMEOUT
+        """
+        with self.cond:
+            if old in self.pending:
+                if not self.cond.wait_for(lambda: old in self.mapping or old in self.failed, self.WAIT_TIMEOUT):
+                    self.failed.add(old)  # Later requests using it do not wait again
+                if old not in self.mapping:
+                    return None
+            return self.mapping.get(old, old)
+
+
+def rewrite(request: CapturedRequest, ids: IdMap, username_suffix: str) -> Optional[bytes]:
+    """Framed request with the recorded IDs replaced by the replayed ones, None if an ID is unknown"""
+    payload = bytearray(request.payload)
+    for start, end in ID_FIELDS.get(request.code, []):
+        new_id = ids.translate(bytes(payload[start:end]))
+        if new_id is None:
+            return None
+        payload[start:end] = new_id
+    if request.code == 600 and username_suffix:
+        # Keep usernames unique when replaying on a server that already has the recorded users
+        name = bytes(payload[:255]).split(b'\x00')[0] + username_suffix.encode('ascii')
+        payload[:255] = (name + b'\x00').ljust(255, b'\x00')[:255]
+
+    client_id = request.client_id
+    if client_id != b'\x00' * 16:
+        client_id = ids.translate(client_id)
+        if client_id is None:
+            return None
+    return client_id + request.header[16:] + bytes(payload)
+
+
+def recv_exact(conn: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = conn.recv(min(65536, size - len(data)))
+        if not chunk:
+            raise ConnectionError("Connection closed by server")
+        data.extend(chunk)
+    return bytes(data)
+
+
+class Replay:
+    def __init__(self, requests: List[CapturedRequest], host: str, port: int, speed: float,
+                 concurrency: int, username_suffix: str = '', timeout: float = 30.0):
+        """
+        Replay of a trace against a server
+        Args:
+            requests (list): Recorded requests in trace order
+            host (str): Server host
+            port (int): Server port
+            speed (float): 1 replays at the recorded pace, 2 twice as fast, 0 as fast as possible
+            concurrency (int): Connections replayed at the same time
+            username_suffix (str): Appended to the usernames of registrations
+            timeout (float): Seconds to wait for a response
+        """
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self.concurrency = concurrency
+        self.username_suffix = username_suffix
+        self.timeout = timeout
+        self.ids = IdMap(requests)
+        self.trace_start = min((request.timestamp for request in requests), default=0.0)
+
+        # Requests without a recorded response were rejected before handling, the server closed
+        # their connection
+        self.skipped = sum(1 for request in requests if request.response_code == 0)
+        self.connections: Dict[int, List[CapturedRequest]] = defaultdict(list)
+        for request in requests:
+            if request.response_code != 0:
+                self.connections[request.connection].append(request)
+
+        self.lock = threading.Lock()
+        self.latencies: Dict[int, List[float]] = defaultdict(list)  # Request code -> seconds
+        self.mismatches = 0  # Responses whose code differs from the recorded one
+        self.errors = 0  # Requests that failed with a connection error or used an ID that was not assigned
+        self.replay_start = 0.0
+
+    def run(self) -> dict:
+        """Replay every connection and return the report"""
+        self.replay_start = time.perf_counter()
+        # Start the connections in the order they were opened, so IDs are usually assigned before use
+        ordered = sorted(self.connections.values(), key=lambda requests: requests[0].timestamp)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            list(executor.map(self.replay_connection, ordered))
+        return self.report(time.perf_counter() - self.replay_start)
+
+    def connect(self) -> socket.socket:
+        return socket.create_connection((self.host, self.port), timeout=self.timeout)
+
+    def replay_connection(self, requests: List[CapturedRequest]):
+        """Send the requests of one recorded connection in order on one connection"""
+        conn: Optional[socket.socket] = None
+        try:
+            for request in requests:
+                if self.speed > 0:
+                    delay = (request.timestamp - self.trace_start) / self.speed
+                    delay -= time.perf_counter() - self.replay_start
+                    if delay > 0:
+                        time.sleep(delay)
+
+                data = rewrite(request, self.ids, self.username_suffix)
+                if data is None:
+                    self.fail(request)
+                    continue
+                try:
+                    if conn is None:
+                        conn = self.connect()
+                    start = time.perf_counter()
+                    conn.sendall(data)
+                    _, code, size = RESPONSE_HEADER.unpack(recv_exact(conn, RESPONSE_HEADER.size))
+                    payload = recv_exact(conn, size)
+                    latency = time.perf_counter() - start
+                except OSError:
+                    self.fail(request)
+                    if conn is not None:
+                        conn.close()
+                        conn = None
+                    continue
+
+                if request.response_code in ASSIGNED_IDS:
+                    size = ASSIGNED_IDS[request.response_code]
+                    if code == request.response_code:
+                        self.ids.learn(request.response_prefix[:size], payload[:size])
+                    else:
+                        # Release the requests waiting for the ID on other connections
+                        self.ids.fail(request.response_prefix[:size])
+                with self.lock:
+                    self.latencies[request.code].append(latency)
+                    if code != request.response_code:
+                        self.mismatches += 1
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def fail(self, request: CapturedRequest):
+        """Count a request that could not be replayed, the IDs it assigned are never learned"""
+        with self.lock:
+            self.errors += 1
+        if request.response_code in ASSIGNED_IDS:
+            self.ids.fail(request.response_prefix[:ASSIGNED_IDS[request.response_code]])
+
+    def report(self, elapsed: float) -> dict:
+        all_latencies = [latency for latencies in self.latencies.values() for latency in latencies]
+        return {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'target': f"{self.host}:{self.port}",
+            'speed': self.speed,
+            'requests': len(all_latencies),
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'mismatches': self.mismatches,
+            'elapsed_s': elapsed,
+            'throughput_rps': len(all_latencies) / elapsed if elapsed > 0 else 0.0,
+            'latency_us': latency_stats(all_latencies),
+            'codes': {str(code): latency_stats(latencies) for code, latencies in sorted(self.latencies.items())},
+        }
+
+
+def latency_stats(latencies: List[float]) -> dict:
+    """Count and percentiles in microseconds"""
+    if not latencies:
+        return {'count': 0}
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1e6
+
+    return {'count': len(ordered), 'p50': percentile(50), 'p90': percentile(90),
+            'p99': percentile(99), 'max': ordered[-1] * 1e6}
+
+
+def print_report(report: dict):
+    print(f"{report['requests']} requests in {report['elapsed_s']:.2f} s: {report['throughput_rps']:.1f} req/s, "
+          f"{report['errors']} errors, {report['mismatches']} response code mismatches, "
+          f"{report['skipped']} skipped")
+    for code, stats in [('all', report['latency_us'])] + list(report['codes'].items()):
+        if stats['count']:
+            print(f"  {code:>4}: {stats['count']:7} requests, p50 {stats['p50']:10.1f} us, "
+                  f"p99 {stats['p99']:10.1f} us, max {stats['max']:10.1f} us")
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """
+    Compare two replay reports of the same trace
+
+    Args:
+        baseline: Report of the reference build
+        current: Report of the build to check
+        threshold: Allowed throughput drop or p50 latency growth in percent
+
+    Returns:
+        list: Descriptions of the regressions beyond the threshold
+    """
+    regressions = []
+
+    def check(name: str, before: float, after: float, higher_is_better: bool):
+        if before <= 0:
+            return
+        change = (after / before - 1) * 100
+        worse = -change if higher_is_better else change
+        flag = ''
+        if worse > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:20} {before:12.1f} -> {after:12.1f} ({change:+.1f}%){flag}")
+
+    check('throughput req/s', baseline['throughput_rps'], current['throughput_rps'], True)
+    rows: List[Tuple[str, dict, dict]] = [('all', baseline['latency_us'], current['latency_us'])]
+    rows += [(code, baseline['codes'][code], stats) for code, stats in current['codes'].items()
+             if code in baseline['codes']]
+    for code, before, after in rows:
+        if before['count'] and after['count']:
+            check(f"{code} p50 us", before['p50'], after['p50'], False)
+            check(f"{code} p99 us", before['p99'], after['p99'], False)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a captured MessageU trace against a server')
+    parser.add_argument('trace', type=Path, help='Trace file written with capture_file')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1357)
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='1 replays at the recorded pace, 2 twice as fast, 0 as fast as possible')
+    parser.add_argument('--concurrency', type=int, default=64, help='Connections replayed at the same time')
+    parser.add_argument('--username-suffix', default='', help='Appended to registered usernames')
+    parser.add_argument('--output', type=Path, help='File to write the report to')
+    parser.add_argument('--compare', type=Path, help='Report of another build to compare against')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Allowed regression in percent')
+    args = parser.parse_args()
+
+    requests = list(read_trace(args.trace))
+    replay = Replay(requests, args.host, args.port, args.speed, args.concurrency, args.username_suffix)
+    print(f"Replaying {len(requests)} requests on {len(replay.connections)} connections")
+    report = replay.run()
+    report['trace'] = str(args.trace)
+    print_report(report)
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"Report written to {args.output}")
+
+    if args.compare is not None:
+        regressions = compare(json.loads(args.compare.read_text()), report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} measures regressed by more than {args.threshold}%")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
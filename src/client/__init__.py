@@ -0,0 +1,6 @@
+from .protocol import ServerError, ReceivedMessage, Request
+from .client import MessageUClient, ConnectionPool, Pipeline
+from .aio import AsyncMessageUClient, AsyncConnectionPool
+
+__all__ = ['MessageUClient', 'AsyncMessageUClient', 'ConnectionPool', 'AsyncConnectionPool',
+           'Pipeline', 'ServerError', 'ReceivedMessage', 'Request']
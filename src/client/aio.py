@@ -0,0 +1,248 @@
+# src/client/aio.py
+
+import time
+import asyncio
+from typing import List, Optional, Tuple
+
+from . import protocol
+from .protocol import Request, ReceivedMessage
+
+
+class AsyncConnection:
+    """A persistent asyncio connection to the server"""
+    MAX_PIPELINE_DEPTH = 64  # Requests written before reading responses, bounds the unread data
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+        self.reused = False
+        self.response_started = False  # True once a byte of a response to the current requests arrived
+        self.closed = False
+
+    @classmethod
+    async def open(cls, host: str, port: int) -> 'AsyncConnection':
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def read_response(self) -> Tuple[int, bytes]:
+        """Read one response, returns (code, payload)"""
+        try:
+            header = await self.reader.readexactly(protocol.RESPONSE_HEADER.size)
+            self.response_started = True
+            _, code, size = protocol.RESPONSE_HEADER.unpack(header)
+            return code, await self.reader.readexactly(size)
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                self.response_started = True
+            raise ConnectionError("Connection closed by server")
+
+    async def roundtrip(self, client_id: bytes, requests: List[Request]) -> List[Tuple[int, bytes]]:
+        """
+        Send the requests in batches of one write each and read their responses
+        The server answers the requests of a connection in order
+        """
+        responses = []
+        self.response_started = False
+        for start in range(0, len(requests), self.MAX_PIPELINE_DEPTH):
+            batch = requests[start:start + self.MAX_PIPELINE_DEPTH]
+            self.writer.write(b''.join(request.encode(client_id) for request in batch))
+            await self.writer.drain()
+            for _ in batch:
+                responses.append(await self.read_response())
+        self.last_used = time.monotonic()
+        self.reused = True
+        return responses
+
+    def close(self):
+        self.closed = True
+        self.writer.close()
+
+
+class AsyncConnectionPool:
+    """Pool of persistent asyncio connections to one server"""
+
+    def __init__(self, host: str, port: int, size: int = 4, max_idle: float = 20.0,
+                 timeout: Optional[float] = 30.0):
+        """
+        Args:
+            host: Server host
+            port: Server port
+            size: Maximum number of idle connections kept open
+            max_idle: Seconds after which an idle connection is dropped, keep below the server's client_timeout
+            timeout: Seconds to wait for the responses of one roundtrip
+        """
+        self.host = host
+        self.port = port
+        self.size = size
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.idle: List[AsyncConnection] = []
+
+    async def acquire(self) -> AsyncConnection:
+        """Take an idle connection or open a new one"""
+        while self.idle:
+            conn = self.idle.pop()
+            if time.monotonic() - conn.last_used < self.max_idle:
+                return conn
+            conn.close()
+        return await AsyncConnection.open(self.host, self.port)
+
+    def release(self, conn: AsyncConnection):
+        """Return a connection to the pool"""
+        if not conn.closed and len(self.idle) < self.size:
+            self.idle.append(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        """Close all idle connections"""
+        for conn in self.idle:
+            conn.close()
+        self.idle = []
+
+
+class AsyncMessageUClient:
+    """asyncio client with a pool of persistent connections, concurrent calls use separate connections"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 1357, client_id: bytes = b'\x00' * 16,
+                 pool_size: int = 4, timeout: Optional[float] = 30.0):
+        """
+        Args:
+            host: Server host
+            port: Server port
+            client_id: 16 bytes ID of this client, set by register()
+            pool_size: Maximum number of idle connections kept open
+            timeout: Seconds to wait for the responses of one roundtrip
+        """
+        self.client_id = client_id
+        self.pool = AsyncConnectionPool(host, port, pool_size, timeout=timeout)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+
+    async def _roundtrip_on(self, conn: AsyncConnection, requests: List[Request]) -> List[Tuple[int, bytes]]:
+        try:
+            responses = await asyncio.wait_for(conn.roundtrip(self.client_id, requests), self.pool.timeout)
+        except BaseException:
+            conn.close()
+            raise
+        self.pool.release(conn)
+        return responses
+
+    async def roundtrip(self, requests: List[Request]) -> List[Tuple[int, bytes]]:
+        """
+        Send requests on one pooled connection and return their raw (code, payload) responses
+        If a reused connection turns out to be closed by the server before any response arrived,
+        the requests are sent again on a new connection, the server did not handle them
+        """
+        conn = await self.pool.acquire()
+        try:
+            return await self._roundtrip_on(conn, requests)
+        except ConnectionError:
+            if not conn.reused or conn.response_started:
+                raise
+        return await self._roundtrip_on(await AsyncConnection.open(self.pool.host, self.pool.port), requests)
+
+    async def call(self, request: Request):
+        """Send one request and return its parsed result"""
+        code, payload = (await self.roundtrip([request]))[0]
+        return request.result(code, payload)
+
+    async def pipeline(self, requests: List[Request]) -> list:
+        """
+        Send several requests on one connection without waiting for each response
+
+        Returns:
+            list: Result of each request, or the ServerError it failed with
+        """
+        results = []
+        for request, (code, payload) in zip(requests, await self.roundtrip(requests)):
+            try:
+                results.append(request.result(code, payload))
+            except protocol.ServerError as e:
+                results.append(e)
+        return results
+
+    async def register(self, username: str, public_key: bytes) -> bytes:
+        """Register and remember the new client ID"""
+        self.client_id = await self.call(protocol.register(username, public_key))
+        return self.client_id
+
+    async def clients_list(self) -> List[Tuple[bytes, str]]:
+        """Return (client ID, username) of every other client"""
+        return await self.call(protocol.clients_list())
+
+    async def public_key(self, client_id: bytes) -> bytes:
+        """Return the public key of a client"""
+        return await self.call(protocol.public_key(client_id))
+
+    async def active_peers(self, window: int = 60) -> List[Tuple[bytes, int]]:
+        """Return (client ID, seconds since last activity) of the other clients active within window seconds"""
+        return await self.call(protocol.active_peers(window))
+
+    async def send_message(self, dest_client_id: bytes, msg_type: int, content: Optional[bytes] = None) -> int:
+        """Send a message, returns its message ID"""
+        return await self.call(protocol.send_message(dest_client_id, msg_type, content))
+
+    async def send_message_idempotent(self, dest_client_id: bytes, msg_type: int, content: Optional[bytes] = None,
+                                      retries: int = 3) -> int:
+        """Send a message with an idempotency key, resending it after connection failures, returns its message ID"""
+        request = protocol.send_message_idempotent(dest_client_id, msg_type, content)
+        for _ in range(retries):
+            try:
+                return await self.call(request)
+            except (OSError, asyncio.TimeoutError):
+                pass
+        return await self.call(request)
+
+    async def pending_messages(self) -> List[ReceivedMessage]:
+        """Fetch and remove the messages waiting for this client"""
+        return await self.call(protocol.pending_messages())
+
+    async def create_group(self, name: str) -> bytes:
+        """Create a group owned by this client, returns the group ID"""
+        return await self.call(protocol.create_group(name))
+
+    async def add_member(self, group_id: bytes, client_id: bytes) -> int:
+        """Add a member to a group owned by this client, returns the member count"""
+        return await self.call(protocol.add_member(group_id, client_id))
+
+    async def remove_member(self, group_id: bytes, client_id: bytes) -> int:
+        """Remove a member from a group, returns the member count"""
+        return await self.call(protocol.remove_member(group_id, client_id))
+
+    async def send_to_group(self, group_id: bytes, msg_type: int, content: Optional[bytes] = None) -> Tuple[int, List[bytes]]:
+        """
+        Send a message to the other group members
+        Returns the number of recipients it was delivered to and the IDs of the members whose
+        node was unreachable; send to those with send_message rather than to the group again
+        """
+        return await self.call(protocol.send_to_group(group_id, msg_type, content))
+
+    async def send_file(self, dest_client_id: bytes, content: bytes, msg_type: int = 4, retries: int = 3) -> int:
+        """
+        Send a large content with a chunked upload, resuming after connection failures
+
+        Returns:
+            int: The message ID
+        """
+        upload_id, chunk_size = await self.call(protocol.upload_open(dest_client_id, msg_type, len(content)))
+        offset = 0
+        failures = 0
+        while offset < len(content):
+            try:
+                offset = await self.call(protocol.upload_chunk(upload_id, offset,
+                                                               content[offset:offset + chunk_size]))
+            except ConnectionError:
+                failures += 1
+                if failures > retries:
+                    raise
+                offset = await self.call(protocol.upload_status(upload_id))
+        return await self.call(protocol.upload_commit(upload_id))
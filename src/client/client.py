@@ -0,0 +1,273 @@
+# src/client/client.py
+
+import time
+import socket
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from . import protocol
+from .protocol import Request, ReceivedMessage
+
+
+class Connection:
+    """A persistent connection to the server"""
+    MAX_PIPELINE_DEPTH = 64  # Requests written before reading responses, bounds the unread data
+
+    def __init__(self, host: str, port: int, timeout: Optional[float] = None):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.last_used = time.monotonic()
+        self.reused = False  # True once it served a request, a later failure may just mean the server closed it
+        self.response_started = False  # True once a byte of a response to the current requests arrived
+        self.closed = False
+
+    def recv_exact(self, size: int) -> bytes:
+        """Receive exactly size bytes, however the data is split into segments"""
+        data = bytearray(size)
+        view = memoryview(data)
+        received = 0
+        while received < size:
+            count = self.sock.recv_into(view[received:], size - received)
+            if count == 0:
+                raise ConnectionError("Connection closed by server")
+            received += count
+            self.response_started = True
+        return bytes(data)
+
+    def read_response(self) -> Tuple[int, bytes]:
+        """Read one response, returns (code, payload)"""
+        _, code, size = protocol.RESPONSE_HEADER.unpack(self.recv_exact(protocol.RESPONSE_HEADER.size))
+        return code, self.recv_exact(size)
+
+    def roundtrip(self, client_id: bytes, requests: List[Request]) -> List[Tuple[int, bytes]]:
+        """
+        Send the requests in batches of one write each and read their responses
+        The server answers the requests of a connection in order
+        """
+        responses = []
+        self.response_started = False
+        for start in range(0, len(requests), self.MAX_PIPELINE_DEPTH):
+            batch = requests[start:start + self.MAX_PIPELINE_DEPTH]
+            self.sock.sendall(b''.join(request.encode(client_id) for request in batch))
+            responses.extend(self.read_response() for _ in batch)
+        self.last_used = time.monotonic()
+        self.reused = True
+        return responses
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
+
+
+class ConnectionPool:
+    """Thread safe pool of persistent connections to one server"""
+
+    def __init__(self, host: str, port: int, size: int = 4, max_idle: float = 20.0,
+                 timeout: Optional[float] = 30.0):
+        """
+        Args:
+            host: Server host
+            port: Server port
+            size: Maximum number of idle connections kept open
+            max_idle: Seconds after which an idle connection is dropped, keep below the server's client_timeout
+            timeout: Socket timeout in seconds
+        """
+        self.host = host
+        self.port = port
+        self.size = size
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.idle: List[Connection] = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, which is returned to the pool unless the request failed"""
+        conn = None
+        with self.lock:
+            while self.idle:
+                candidate = self.idle.pop()
+                if time.monotonic() - candidate.last_used < self.max_idle:
+                    conn = candidate
+                    break
+                candidate.close()
+        if conn is None:
+            conn = Connection(self.host, self.port, self.timeout)
+
+        try:
+            yield conn
+        except BaseException:
+            conn.close()
+            raise
+
+        with self.lock:
+            if not conn.closed and len(self.idle) < self.size:
+                self.idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """Close all idle connections"""
+        with self.lock:
+            for conn in self.idle:
+                conn.close()
+            self.idle = []
+
+
+class Pipeline:
+    """Collects requests and sends them on one connection without waiting for each response"""
+
+    def __init__(self, client: 'MessageUClient'):
+        self.client = client
+        self.requests: List[Request] = []
+
+    def add(self, request: Request) -> 'Pipeline':
+        """Queue a request built with the protocol module"""
+        self.requests.append(request)
+        return self
+
+    def execute(self) -> list:
+        """
+        Send the queued requests
+
+        Returns:
+            list: Result of each request, or the ServerError it failed with
+        """
+        requests, self.requests = self.requests, []
+        results = []
+        for request, (code, payload) in zip(requests, self.client.roundtrip(requests)):
+            try:
+                results.append(request.result(code, payload))
+            except protocol.ServerError as e:
+                results.append(e)
+        return results
+
+
+class MessageUClient:
+    """Synchronous client with a pool of persistent connections"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 1357, client_id: bytes = b'\x00' * 16,
+                 pool_size: int = 4, timeout: Optional[float] = 30.0):
+        """
+        Args:
+            host: Server host
+            port: Server port
+            client_id: 16 bytes ID of this client, set by register()
+            pool_size: Maximum number of idle connections kept open
+            timeout: Socket timeout in seconds
+        """
+        self.client_id = client_id
+        self.pool = ConnectionPool(host, port, pool_size, timeout=timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+
+    def roundtrip(self, requests: List[Request]) -> List[Tuple[int, bytes]]:
+        """
+        Send requests on one pooled connection and return their raw (code, payload) responses
+        If a reused connection turns out to be closed by the server before any response arrived,
+        the requests are sent again on a new connection: the server only closes idle connections
+        between requests, e.g. after client_timeout or during an upgrade, without handling them
+        """
+        with self.pool.connection() as conn:
+            reused = conn.reused
+            try:
+                return conn.roundtrip(self.client_id, requests)
+            except ConnectionError:
+                conn.close()
+                if not reused or conn.response_started:
+                    raise
+        with self.pool.connection() as conn:
+            return conn.roundtrip(self.client_id, requests)
+
+    def call(self, request: Request):
+        """Send one request and return its parsed result"""
+        code, payload = self.roundtrip([request])[0]
+        return request.result(code, payload)
+
+    def pipeline(self) -> Pipeline:
+        """Start a pipeline of requests sent on one connection"""
+        return Pipeline(self)
+
+    def register(self, username: str, public_key: bytes) -> bytes:
+        """Register and remember the new client ID"""
+        self.client_id = self.call(protocol.register(username, public_key))
+        return self.client_id
+
+    def clients_list(self) -> List[Tuple[bytes, str]]:
+        """Return (client ID, username) of every other client"""
+        return self.call(protocol.clients_list())
+
+    def public_key(self, client_id: bytes) -> bytes:
+        """Return the public key of a client"""
+        return self.call(protocol.public_key(client_id))
+
+    def active_peers(self, window: int = 60) -> List[Tuple[bytes, int]]:
+        """Return (client ID, seconds since last activity) of the other clients active within window seconds"""
+        return self.call(protocol.active_peers(window))
+
+    def send_message(self, dest_client_id: bytes, msg_type: int, content: Optional[bytes] = None) -> int:
+        """Send a message, returns its message ID"""
+        return self.call(protocol.send_message(dest_client_id, msg_type, content))
+
+    def send_message_idempotent(self, dest_client_id: bytes, msg_type: int, content: Optional[bytes] = None,
+                                retries: int = 3) -> int:
+        """Send a message with an idempotency key, resending it after connection failures, returns its message ID"""
+        request = protocol.send_message_idempotent(dest_client_id, msg_type, content)
+        for _ in range(retries):
+            try:
+                return self.call(request)
+            except OSError:
+                pass
+        return self.call(request)
+
+    def pending_messages(self) -> List[ReceivedMessage]:
+        """Fetch and remove the messages waiting for this client"""
+        return self.call(protocol.pending_messages())
+
+    def create_group(self, name: str) -> bytes:
+        """Create a group owned by this client, returns the group ID"""
+        return self.call(protocol.create_group(name))
+
+    def add_member(self, group_id: bytes, client_id: bytes) -> int:
+        """Add a member to a group owned by this client, returns the member count"""
+        return self.call(protocol.add_member(group_id, client_id))
+
+    def remove_member(self, group_id: bytes, client_id: bytes) -> int:
+        """Remove a member from a group, returns the member count"""
+        return self.call(protocol.remove_member(group_id, client_id))
+
+    def send_to_group(self, group_id: bytes, msg_type: int, content: Optional[bytes] = None) -> Tuple[int, List[bytes]]:
+        """
+        Send a message to the other group members
+        Returns the number of recipients it was delivered to and the IDs of the members whose
+        node was unreachable; send to those with send_message rather than to the group again
+        """
+        return self.call(protocol.send_to_group(group_id, msg_type, content))
+
+    def send_file(self, dest_client_id: bytes, content: bytes, msg_type: int = 4, retries: int = 3) -> int:
+        """
+        Send a large content with a chunked upload, resuming after connection failures
+
+        Returns:
+            int: The message ID
+        """
+        upload_id, chunk_size = self.call(protocol.upload_open(dest_client_id, msg_type, len(content)))
+        offset = 0
+        failures = 0
+        while offset < len(content):
+            try:
+                offset = self.call(protocol.upload_chunk(upload_id, offset, content[offset:offset + chunk_size]))
+            except ConnectionError:
+                failures += 1
+                if failures > retries:
+                    raise
+                offset = self.call(protocol.upload_status(upload_id))
+        return self.call(protocol.upload_commit(upload_id))
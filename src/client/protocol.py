@@ -0,0 +1,232 @@
+# src/client/protocol.py
+
+import os
+import struct
+from typing import Callable, List, Optional, Tuple
+
+VERSION = 1
+HEADER = struct.Struct('<16sBHI')  # Client ID, version, code, payload size
+RESPONSE_HEADER = struct.Struct('<BHI')  # Version, code, payload size
+
+# Request codes
+REGISTER = 600
+CLIENTS_LIST = 601
+PUBLIC_KEY = 602
+SEND_MESSAGE = 603
+PENDING_MESSAGES = 604
+UPLOAD_OPEN = 605
+UPLOAD_CHUNK = 606
+UPLOAD_STATUS = 607
+UPLOAD_COMMIT = 608
+SEND_MESSAGE_IDEMPOTENT = 609
+CREATE_GROUP = 610
+ADD_MEMBER = 611
+REMOVE_MEMBER = 612
+SEND_TO_GROUP = 613
+ACTIVE_PEERS = 614
+
+# Response codes
+ERROR = 9000
+
+
+class ServerError(Exception):
+    """The server answered a request with an error (code 9000)"""
+
+    def __init__(self, request_code: int):
+        super().__init__(f"Server returned an error for request {request_code}")
+        self.request_code = request_code
+
+
+class ReceivedMessage:
+    def __init__(self, ID: int, from_client: bytes, msg_type: int, content: bytes):
+        """
+        A message fetched from the server (code 604)
+        Args:
+            ID (int): 4 bytes message identifier
+            from_client (bytes): 16 bytes sender identifier
+            msg_type (int): 1 byte message type
+            content (bytes): Message content, empty if none
+        """
+        self.ID = ID
+        self.from_client = from_client
+        self.type = msg_type
+        self.content = content
+
+    def __str__(self):
+        """String representation of the message"""
+        return f"ReceivedMessage(ID={self.ID}, type={self.type}, content_size={len(self.content)})"
+
+
+class Request:
+    def __init__(self, code: int, payload: bytes, expected: int, parse: Callable[[bytes], object]):
+        """
+        A request and how to interpret its response
+        Args:
+            code (int): Request code
+            payload (bytes): Request payload
+            expected (int): Response code of a successful response
+            parse (callable): Turns the successful response payload into the result
+        """
+        self.code = code
+        self.payload = payload
+        self.expected = expected
+        self.parse = parse
+
+    def encode(self, client_id: bytes) -> bytes:
+        """Frame the request with the header for the given client ID"""
+        return HEADER.pack(client_id, VERSION, self.code, len(self.payload)) + self.payload
+
+    def result(self, code: int, payload: bytes):
+        """Return the parsed result of the response, raising ServerError on an error response"""
+        if code == ERROR:
+            raise ServerError(self.code)
+        if code != self.expected:
+            raise ValueError(f"Unexpected response code {code} for request {self.code}")
+        return self.parse(payload)
+
+
+def register(username: str, public_key: bytes) -> Request:
+    """Registration request (600), result is the new client ID"""
+    name = username.encode('ascii') + b'\x00'
+    if len(name) > 255:
+        raise ValueError("Username must be max 254 bytes in ASCII")
+    if len(public_key) != 160:
+        raise ValueError("Public key must be 160 bytes")
+    return Request(REGISTER, name.ljust(255, b'\x00') + public_key, 2100, bytes)
+
+
+def clients_list() -> Request:
+    """Clients list request (601), result is a list of (client ID, username)"""
+    return Request(CLIENTS_LIST, b'', 2101, parse_clients_list)
+
+
+def public_key(client_id: bytes) -> Request:
+    """Public key request (602), result is the 160 bytes public key"""
+    return Request(PUBLIC_KEY, client_id, 2102, lambda payload: payload[16:])
+
+
+def send_message(dest_client_id: bytes, msg_type: int, content: Optional[bytes] = None) -> Request:
+    """Send message request (603), result is the message ID"""
+    content = content or b''
+    payload = dest_client_id + struct.pack('<BI', msg_type, len(content)) + content
+    return Request(SEND_MESSAGE, payload, 2103, parse_message_id)
+
+
+def send_message_idempotent(dest_client_id: bytes, msg_type: int, content: Optional[bytes] = None,
+                            nonce: Optional[bytes] = None) -> Request:
+    """
+    Send message request with an idempotency key (609), result is the message ID
+    Sending the same request again returns the original message ID without a second copy
+    """
+    nonce = nonce or os.urandom(16)
+    if len(nonce) != 16:
+        raise ValueError("Idempotency key must be 16 bytes")
+    request = send_message(dest_client_id, msg_type, content)
+    return Request(SEND_MESSAGE_IDEMPOTENT, nonce + request.payload, 2103, parse_message_id)
+
+
+def pending_messages() -> Request:
+    """Pending messages request (604), result is a list of ReceivedMessage"""
+    return Request(PENDING_MESSAGES, b'', 2104, parse_pending_messages)
+
+
+def upload_open(dest_client_id: bytes, msg_type: int, total_size: int) -> Request:
+    """Upload open request (605), result is (upload ID, maximum chunk size)"""
+    payload = dest_client_id + struct.pack('<BI', msg_type, total_size)
+    return Request(UPLOAD_OPEN, payload, 2105, lambda payload: struct.unpack('<II', payload))
+
+
+def upload_chunk(upload_id: int, offset: int, data: bytes) -> Request:
+    """Upload chunk request (606), result is the size received by the server"""
+    return Request(UPLOAD_CHUNK, struct.pack('<II', upload_id, offset) + data, 2106, parse_received)
+
+
+def upload_status(upload_id: int) -> Request:
+    """Upload status request (607), result is the size received by the server"""
+    return Request(UPLOAD_STATUS, struct.pack('<I', upload_id), 2106, parse_received)
+
+
+def upload_commit(upload_id: int) -> Request:
+    """Upload commit request (608), result is the message ID"""
+    return Request(UPLOAD_COMMIT, struct.pack('<I', upload_id), 2103, parse_message_id)
+
+
+def create_group(name: str) -> Request:
+    """Group creation request (610), result is the group ID"""
+    encoded = name.encode('ascii') + b'\x00'
+    if len(encoded) > 255:
+        raise ValueError("Group name must be max 254 bytes in ASCII")
+    return Request(CREATE_GROUP, encoded.ljust(255, b'\x00'), 2110, bytes)
+
+
+def add_member(group_id: bytes, client_id: bytes) -> Request:
+    """Add group member request (611), result is the member count"""
+    return Request(ADD_MEMBER, group_id + client_id, 2111, parse_group_count)
+
+
+def remove_member(group_id: bytes, client_id: bytes) -> Request:
+    """Remove group member request (612), result is the member count"""
+    return Request(REMOVE_MEMBER, group_id + client_id, 2111, parse_group_count)
+
+
+def send_to_group(group_id: bytes, msg_type: int, content: Optional[bytes] = None) -> Request:
+    """
+    Send to group request (613), result is the number of recipients the message was delivered to
+    and the IDs of the members it could not be delivered to
+    """
+    content = content or b''
+    payload = group_id + struct.pack('<BI', msg_type, len(content)) + content
+    return Request(SEND_TO_GROUP, payload, 2113, parse_group_delivery)
+
+
+def active_peers(window: int) -> Request:
+    """Active peers request (614), result is a list of (client ID, seconds since last activity)"""
+    return Request(ACTIVE_PEERS, struct.pack('<I', window), 2114, parse_active_peers)
+
+
+def parse_clients_list(payload: bytes) -> List[Tuple[bytes, str]]:
+    """Parse a 2101 payload of client ID (16 bytes) and null padded username (255 bytes) entries"""
+    clients = []
+    for offset in range(0, len(payload) - 270, 271):
+        username = payload[offset + 16:offset + 271].split(b'\x00')[0].decode('ascii')
+        clients.append((payload[offset:offset + 16], username))
+    return clients
+
+
+def parse_active_peers(payload: bytes) -> List[Tuple[bytes, int]]:
+    """Parse a 2114 payload of client ID (16 bytes) and idle seconds (4 bytes) entries"""
+    return [(payload[offset:offset + 16], struct.unpack_from('<I', payload, offset + 16)[0])
+            for offset in range(0, len(payload) - 19, 20)]
+
+
+def parse_message_id(payload: bytes) -> int:
+    """Parse a 2103 payload of destination client ID (16 bytes) and message ID (4 bytes)"""
+    return struct.unpack('<I', payload[16:20])[0]
+
+
+def parse_group_count(payload: bytes) -> int:
+    """Parse a 2111 or 2113 payload of group ID (16 bytes) and a count (4 bytes)"""
+    return struct.unpack('<I', payload[16:20])[0]
+
+
+def parse_group_delivery(payload: bytes) -> Tuple[int, List[bytes]]:
+    """Parse a 2113 payload of group ID (16 bytes), delivered count (4 bytes) and undelivered IDs (16 bytes each)"""
+    return parse_group_count(payload), [payload[i:i + 16] for i in range(20, len(payload), 16)]
+
+
+def parse_received(payload: bytes) -> int:
+    """Parse a 2106 payload of upload ID (4 bytes) and received size (4 bytes)"""
+    return struct.unpack('<II', payload)[1]
+
+
+def parse_pending_messages(payload: bytes) -> List[ReceivedMessage]:
+    """Parse a 2104 payload of sender ID, message ID, type, content size and content entries"""
+    messages = []
+    offset = 0
+    while offset < len(payload):
+        from_client = payload[offset:offset + 16]
+        message_id, msg_type, size = struct.unpack_from('<IBI', payload, offset + 16)
+        offset += 25
+        messages.append(ReceivedMessage(message_id, from_client, msg_type, payload[offset:offset + size]))
+        offset += size
+    return messages
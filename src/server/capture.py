@@ -0,0 +1,175 @@
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Iterator
+
+MAGIC = b'MUTRACE1'
+# Arrival time (epoch seconds), connection ID, handling time (microseconds), response size,
+# response code, size of the recorded response prefix; followed by the 23 bytes request header,
+# the request payload and the response prefix
+RECORD = struct.Struct('<dQIIHH')
+REQUEST_HEADER = struct.Struct('<16sBHI')
+RESPONSE_HEADER_SIZE = 7
+
+REDACT_MODES = ('none', 'zero', 'random')
+# Offset of the message content in the payload of requests carrying one
+CONTENT_OFFSETS = {603: 21, 606: 8, 609: 37, 613: 21}
+# Responses carrying IDs a replay needs to map: client, message, upload and group IDs
+ID_RESPONSES = (2100, 2103, 2105, 2106, 2110, 2111, 2113)
+RESPONSE_PREFIX_SIZE = 32
+
+
+class CapturedRequest:
+    def __init__(self, timestamp: float, connection: int, duration_us: int, response_size: int,
+                 response_code: int, header: bytes, payload: bytes, response_prefix: bytes):
+        """
+        One request read from a trace file
+        Args:
+            timestamp (float): Arrival time of the request header (epoch seconds)
+            connection (int): ID of the connection the request came on
+            duration_us (int): Time the server took to handle the request (microseconds)
+            response_size (int): Bytes sent in response, header included
+            response_code (int): Code of the response, 0 if none was sent
+            header (bytes): 23 bytes request header
+            payload (bytes): Request payload, content possibly redacted
+            response_prefix (bytes): Start of the response payload for responses carrying IDs
+        """
+        self.timestamp = timestamp
+        self.connection = connection
+        self.duration_us = duration_us
+        self.response_size = response_size
+        self.response_code = response_code
+        self.header = header
+        self.payload = payload
+        self.response_prefix = response_prefix
+        self.client_id, _, self.code, _ = REQUEST_HEADER.unpack(header)
+
+    def __str__(self):
+        """String representation of the request"""
+        return (f"CapturedRequest(code={self.code}, payload_size={len(self.payload)}, "
+                f"response_code={self.response_code}, duration_us={self.duration_us})")
+
+
+class CaptureSocket:
+    """Socket wrapper counting the response bytes and keeping the start of the response"""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self.sent_size = 0
+        self.head = bytearray()
+
+    def _record(self, data: bytes, size: int):
+        self.sent_size += size
+        missing = RESPONSE_HEADER_SIZE + RESPONSE_PREFIX_SIZE - len(self.head)
+        if missing > 0:
+            self.head.extend(data[:min(missing, size)])
+
+    def send(self, data: bytes) -> int:
+        size = self._sock.send(data)
+        self._record(data, size)
+        return size
+
+    def sendall(self, data: bytes):
+        self._sock.sendall(data)
+        self._record(data, len(data))
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class TrafficCapture:
+    def __init__(self, path: Path, redact: str = 'none'):
+        """
+        Append captured requests to a trace file
+        Each record is written with a single unbuffered write, so a new process taking over
+        during an upgrade can append to the same file
+        Args:
+            path (Path): Trace file, created with its header if missing
+            redact (str): 'none' keeps message contents, 'zero' replaces them with zero bytes
+                          and 'random' with random bytes of the same length
+        """
+        if redact not in REDACT_MODES:
+            raise ValueError(f"Invalid capture redaction mode: {redact}")
+        self.path = path
+        self.redact = redact
+        self.lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(path, 'ab', buffering=0)
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+
+    def redacted(self, code: int, payload: bytes) -> bytes:
+        """Request payload with its message content replaced according to the redaction mode"""
+        offset = CONTENT_OFFSETS.get(code)
+        if self.redact == 'none' or offset is None or len(payload) <= offset:
+            return payload
+        size = len(payload) - offset
+        filler = b'\x00' * size if self.redact == 'zero' else os.urandom(size)
+        return payload[:offset] + filler
+
+    def record(self, timestamp: float, connection: int, duration: float, header: bytes, payload: bytes,
+               response: CaptureSocket):
+        """
+        Write one handled request to the trace file
+
+        Args:
+            timestamp: Arrival time of the request header (epoch seconds)
+            connection: Number of the connection within this process
+            duration: Seconds spent handling the request
+            header: 23 bytes request header
+            payload: Request payload
+            response: The wrapped socket the response was sent on
+        """
+        # Processes appending to the same file during an upgrade number their connections alike
+        connection = (os.getpid() << 32) | connection
+        code = struct.unpack('<H', header[17:19])[0]
+        response_code = 0
+        prefix = b''
+        if len(response.head) >= RESPONSE_HEADER_SIZE:
+            response_code = struct.unpack('<H', response.head[1:3])[0]
+            if response_code in ID_RESPONSES:
+                prefix = bytes(response.head[RESPONSE_HEADER_SIZE:])
+
+        data = b''.join((
+            RECORD.pack(timestamp, connection, min(int(duration * 1e6), 0xFFFFFFFF),
+                        min(response.sent_size, 0xFFFFFFFF), response_code, len(prefix)),
+            header,
+            self.redacted(code, payload),
+            prefix,
+        ))
+        with self.lock:
+            # A capture replaced on reload may still be used by requests in progress
+            if self.file is not None:
+                self.file.write(data)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_trace(path: Path) -> Iterator[CapturedRequest]:
+    """Read the requests of a trace file in the order they were recorded"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a MessageU trace file")
+        while True:
+            record = f.read(RECORD.size)
+            if len(record) < RECORD.size:
+                return
+            timestamp, connection, duration_us, response_size, response_code, prefix_size = RECORD.unpack(record)
+            header = f.read(REQUEST_HEADER.size)
+            if len(header) < REQUEST_HEADER.size:
+                return
+            payload_size = REQUEST_HEADER.unpack(header)[3]
+            payload = f.read(payload_size)
+            prefix = f.read(prefix_size)
+            if len(payload) < payload_size or len(prefix) < prefix_size:
+                # The last record of a trace whose writer was killed
+                return
+            yield CapturedRequest(timestamp, connection, duration_us, response_size, response_code,
+                                  header, payload, prefix)
+
@@ -0,0 +1,223 @@
+# src/server/cluster.py
+
+import time
+import bisect
+import socket
+import threading
+import struct
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+
+# Requests routed to the node owning the client or group ID they concern, registrations to the
+# node owning the username so concurrent registrations of one name meet on the same node
+ROUTED_CODES = (600, 603, 604, 605, 606, 607, 608, 609, 611, 612, 613)
+
+
+def parse_nodes(spec: str) -> Dict[str, Tuple[str, int]]:
+    """
+    Parse a cluster node list of the form "name=host:port,name=host:port"
+
+    Returns:
+        dict: Node name -> (host, port)
+    """
+    nodes = {}
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, address = entry.partition('=')
+        host, _, port = address.rpartition(':')
+        if not name or not host or not port:
+            raise ValueError(f"Invalid cluster node entry: {entry}")
+        nodes[name.strip()] = (host.strip(), int(port))
+    return nodes
+
+
+class HashRing:
+    """Consistent hash ring mapping 16 byte client IDs to node names"""
+    VIRTUAL_NODES = 64  # Points per node, evens out the hash ranges
+
+    def __init__(self, nodes: List[str]):
+        self.points: List[int] = []
+        self.owners: List[str] = []
+        for point, name in sorted((self.hash(f"{name}#{i}".encode()), name)
+                                  for name in nodes for i in range(self.VIRTUAL_NODES)):
+            self.points.append(point)
+            self.owners.append(name)
+
+    @staticmethod
+    def hash(key: bytes) -> int:
+        return int.from_bytes(hashlib.md5(key).digest()[:8], 'little')
+
+    def owner(self, key: bytes) -> str:
+        """Return the node owning the first ring point at or after the key's hash"""
+        index = bisect.bisect_left(self.points, self.hash(key))
+        return self.owners[index % len(self.owners)]
+
+
+class Cluster:
+    FORWARD_TIMEOUT = 30.0  # Seconds to wait for a peer node
+    POOL_SIZE = 8  # Idle connections kept open per peer node
+    MAX_IDLE = 20.0  # Seconds after which an idle connection is dropped, below the peers' client_timeout
+
+    def __init__(self, node_id: str, nodes: Dict[str, Tuple[str, int]]):
+        """
+        Initialize the cluster view of one node
+        Args:
+            node_id (str): Name of this node, must appear in nodes
+            nodes (dict): Node name -> (host, port) for every node including this one
+        """
+        if node_id not in nodes:
+            raise ValueError(f"Node {node_id} is not part of the cluster")
+
+        self.node_id = node_id
+        self.nodes = nodes
+        self.ring = HashRing(list(nodes))
+        # Upload IDs carry the index of the node holding the upload in their top byte
+        self.node_index = sorted(nodes).index(node_id)
+        self.peer_hosts = {socket.gethostbyname(host) for host, _ in nodes.values()}
+        # Node name -> idle (connection, last used) pairs
+        self.idle: Dict[str, List[Tuple[socket.socket, float]]] = {name: [] for name in nodes}
+        self.idle_lock = threading.Lock()
+
+    def peers(self) -> List[str]:
+        """Names of the other nodes"""
+        return [name for name in self.nodes if name != self.node_id]
+
+    def is_local(self, key: bytes) -> bool:
+        """Check whether this node owns a client or group ID"""
+        return self.ring.owner(key) == self.node_id
+
+    def is_peer_address(self, host: str) -> bool:
+        """Check whether a connection comes from a cluster node's host"""
+        return host in self.peer_hosts
+
+    def request_owner(self, code: int, client_id: bytes, payload: bytes) -> str:
+        """Return the node that must handle a routed request"""
+        if code == 600:
+            return self.ring.owner(payload[:255].split(b'\x00')[0])
+        if code == 604:
+            return self.ring.owner(client_id)
+        if code in (603, 605, 611, 612, 613):
+            return self.ring.owner(payload[:16])
+        if code == 609:
+            # The destination follows the idempotency key
+            return self.ring.owner(payload[16:32])
+        # 606-608 carry the upload ID, whose top byte is the node index
+        upload_id = struct.unpack('<I', payload[:4])[0]
+        return sorted(self.nodes)[(upload_id >> 24) % len(self.nodes)]
+
+    def connect(self, node: str) -> socket.socket:
+        """Open a connection to a peer node"""
+        return socket.create_connection(self.nodes[node], timeout=self.FORWARD_TIMEOUT)
+
+    def acquire(self, node: str) -> Tuple[socket.socket, bool]:
+        """
+        Take an idle connection to a peer node or open a new one
+
+        Returns:
+            tuple: (connection, True if it was used before)
+        """
+        with self.idle_lock:
+            while self.idle[node]:
+                conn, last_used = self.idle[node].pop()
+                if time.monotonic() - last_used < self.MAX_IDLE:
+                    return conn, True
+                conn.close()
+        return self.connect(node), False
+
+    def release(self, node: str, conn: socket.socket):
+        """Return a connection whose response was read completely"""
+        with self.idle_lock:
+            if len(self.idle[node]) < self.POOL_SIZE:
+                self.idle[node].append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def open_request(self, node: str, code: int, payload: bytes,
+                     client_id: bytes = b'\x00' * 16) -> Tuple[socket.socket, bytes]:
+        """
+        Send a request to a peer node on a pooled connection and read the response header
+        The caller reads the response payload, then releases or closes the connection
+
+        Returns:
+            tuple: (connection, 7 bytes response header)
+        """
+        data = struct.pack('<16sBHI', client_id, 1, code, len(payload)) + payload
+        conn, reused = self.acquire(node)
+        try:
+            conn.sendall(data)
+            return conn, recv_exact(conn, 7)
+        except ConnectionError:
+            conn.close()
+            if not reused:
+                raise
+        except Exception:
+            conn.close()
+            raise
+        # Peers only close connections between requests, so the request was not handled
+        conn = self.connect(node)
+        try:
+            conn.sendall(data)
+            return conn, recv_exact(conn, 7)
+        except Exception:
+            conn.close()
+            raise
+
+    def request(self, node: str, code: int, payload: bytes) -> Tuple[int, bytes]:
+        """
+        Send an internal request to a peer node and wait for its response
+
+        Returns:
+            tuple: (response code, response payload)
+        """
+        conn, header = self.open_request(node, code, payload)
+        try:
+            _, response_code, size = struct.unpack('<BHI', header)
+            response = recv_exact(conn, size)
+        except Exception:
+            conn.close()
+            raise
+        self.release(node, conn)
+        return response_code, response
+
+    def broadcast(self, code: int, payload: bytes) -> List[str]:
+        """
+        Send an internal request to every peer node
+
+        Returns:
+            list: Names of the nodes that could not be reached or failed
+        """
+        failed = []
+        for node in self.peers():
+            try:
+                response_code, _ = self.request(node, code, payload)
+                if response_code == 9000:
+                    failed.append(node)
+            except OSError as e:
+                logging.warning(f"Cluster node {node} unreachable: {e}")
+                failed.append(node)
+        return failed
+
+    def first_peer_response(self, code: int, payload: bytes) -> Optional[bytes]:
+        """Send an internal request to the peers in turn and return the first successful response payload"""
+        for node in self.peers():
+            try:
+                response_code, response = self.request(node, code, payload)
+                if response_code != 9000:
+                    return response
+            except OSError as e:
+                logging.warning(f"Cluster node {node} unreachable: {e}")
+        return None
+
+
+def recv_exact(conn: socket.socket, size: int) -> bytes:
+    """Receive exactly size bytes from a peer node"""
+    data = bytearray()
+    while len(data) < size:
+        chunk = conn.recv(min(65536, size - len(data)))
+        if not chunk:
+            raise ConnectionError("Connection closed by cluster node")
+        data.extend(chunk)
+    return bytes(data)
@@ -0,0 +1,66 @@
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class DedupeTable:
+    def __init__(self, max_entries: int, ttl: float):
+        """
+        Remember the message ID assigned to each idempotency key (nonce) of a sender,
+        so retried sends are answered without storing the message again
+        Not thread safe, must be used with the server lock held
+        Args:
+            max_entries (int): Keys kept per sender, the oldest are dropped first
+            ttl (float): Seconds a key is remembered
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Sender ID -> (nonce -> (destination ID, message ID, time recorded)),
+        # both ordered from the least to the most recently recorded
+        self.senders: 'OrderedDict[bytes, OrderedDict[bytes, Tuple[bytes, int, float]]]' = OrderedDict()
+
+    def get(self, sender: bytes, nonce: bytes) -> Optional[Tuple[bytes, int]]:
+        """
+        Look up a key of a sender
+
+        Returns:
+            tuple: (destination ID, message ID) of the original send, None if unknown or expired
+        """
+        entries = self.senders.get(sender)
+        if entries is None or nonce not in entries:
+            return None
+        dest_client_id, message_id, recorded = entries[nonce]
+        if time.monotonic() - recorded > self.ttl:
+            return None
+        return dest_client_id, message_id
+
+    def record(self, sender: bytes, nonce: bytes, dest_client_id: bytes, message_id: int):
+        """Remember the message ID assigned to a key and drop expired or surplus keys"""
+        now = time.monotonic()
+        entries = self.senders.pop(sender, None) or OrderedDict()
+        entries.pop(nonce, None)
+        entries[nonce] = (dest_client_id, message_id, now)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        self.expire_entries(entries, now)
+        self.senders[sender] = entries
+
+        # Senders are ordered by their latest key, stop at the first one still in use
+        while self.senders:
+            oldest = next(iter(self.senders.values()))
+            if self.expire_entries(oldest, now):
+                break
+            self.senders.popitem(last=False)
+
+    def expire_entries(self, entries: 'OrderedDict[bytes, Tuple[bytes, int, float]]', now: float) -> int:
+        """Drop the expired keys of one sender, returns the number of keys left"""
+        while entries:
+            _, _, recorded = next(iter(entries.values()))
+            if now - recorded <= self.ttl:
+                break
+            entries.popitem(last=False)
+        return len(entries)
+
+    def __len__(self):
+        """Number of keys remembered over all senders"""
+        return sum(len(entries) for entries in self.senders.values())
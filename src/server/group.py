@@ -0,0 +1,27 @@
+from typing import Set
+
+
+class Group:
+    def __init__(self, ID: bytes, name: str, owner: bytes):
+        """
+        Initialize a new group
+        Args:
+            ID (bytes): 16 bytes (128 bit) unique identifier
+            name (str): ASCII group name (null terminated, max 255 bytes)
+            owner (bytes): 16 bytes identifier of the creating client, the first member
+        """
+        if len(ID) != 16:
+            raise ValueError("ID must be 16 bytes")
+        if len(name.encode('ascii')) > 255:
+            raise ValueError("Name must be max 255 bytes in ASCII")
+        if len(owner) != 16:
+            raise ValueError("owner must be 16 bytes")
+
+        self.ID = ID
+        self.name = name
+        self.owner = owner
+        self.members: Set[bytes] = {owner}
+
+    def __str__(self):
+        """String representation of the group"""
+        return f"Group(name={self.name}, members={len(self.members)})"
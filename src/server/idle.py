@@ -0,0 +1,112 @@
+# src/server/idle.py
+
+import time
+import heapq
+import socket
+import logging
+import threading
+import itertools
+import selectors
+from typing import Callable, List, Optional, Tuple
+
+
+class IdlePoller:
+    def __init__(self, on_ready: Callable[[socket.socket, object], None],
+                 on_expired: Callable[[socket.socket, object], None]):
+        """
+        Watches connections waiting for their next request, so they do not hold a worker thread
+        Args:
+            on_ready (callable): Called with a connection and its state once it has data, or its end, to read
+            on_expired (callable): Called with a connection and its state when it waited past its timeout,
+                                   or when the poller stops
+        """
+        self.on_ready = on_ready
+        self.on_expired = on_expired
+        self.selector = selectors.DefaultSelector()
+        # Parking a connection wakes the poller up through this pair
+        self.wakeup_recv, self.wakeup_send = socket.socketpair()
+        self.wakeup_recv.setblocking(False)
+        self.wakeup_send.setblocking(False)
+        self.selector.register(self.wakeup_recv, selectors.EVENT_READ)
+        self.lock = threading.Lock()
+        self.incoming: List[Tuple[socket.socket, object, Optional[float]]] = []
+        # (deadline, token, connection), entries of connections that left the poller are skipped
+        self.deadlines: List[Tuple[float, int, socket.socket]] = []
+        self.tokens = itertools.count()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def park(self, client_socket: socket.socket, state: object, timeout: float):
+        """
+        Watch a connection until it is readable
+        Args:
+            client_socket: Connection waiting for a request
+            state: Passed back to the callbacks
+            timeout: Seconds to wait, 0 waits forever
+        """
+        deadline = time.monotonic() + timeout if timeout > 0 else None
+        with self.lock:
+            self.incoming.append((client_socket, state, deadline))
+        self.wake()
+
+    def wake(self):
+        try:
+            self.wakeup_send.send(b'\x00')
+        except BlockingIOError:
+            pass  # A wakeup is already pending
+
+    def stop(self):
+        """Stop watching, the parked connections are passed to on_expired"""
+        self.running = False
+        self.wake()
+        self.thread.join()
+
+    def run(self):
+        while self.running:
+            with self.lock:
+                incoming, self.incoming = self.incoming, []
+            for client_socket, state, deadline in incoming:
+                token = next(self.tokens)
+                self.selector.register(client_socket, selectors.EVENT_READ, (state, token))
+                if deadline is not None:
+                    heapq.heappush(self.deadlines, (deadline, token, client_socket))
+
+            timeout = max(0.0, self.deadlines[0][0] - time.monotonic()) if self.deadlines else None
+            for key, _ in self.selector.select(timeout):
+                if key.fileobj is self.wakeup_recv:
+                    try:
+                        while self.wakeup_recv.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                self.selector.unregister(key.fileobj)
+                self.hand_back(self.on_ready, key.fileobj, key.data[0])
+
+            now = time.monotonic()
+            while self.deadlines and self.deadlines[0][0] <= now:
+                _, token, client_socket = heapq.heappop(self.deadlines)
+                key = self.selector.get_map().get(client_socket)
+                if key is not None and key.data[1] == token:
+                    self.selector.unregister(client_socket)
+                    self.hand_back(self.on_expired, client_socket, key.data[0])
+
+        for key in list(self.selector.get_map().values()):
+            if key.fileobj is not self.wakeup_recv:
+                self.selector.unregister(key.fileobj)
+                self.hand_back(self.on_expired, key.fileobj, key.data[0])
+        with self.lock:
+            incoming, self.incoming = self.incoming, []
+        for client_socket, state, _ in incoming:
+            self.hand_back(self.on_expired, client_socket, state)
+        self.selector.close()
+        self.wakeup_recv.close()
+        self.wakeup_send.close()
+
+    @staticmethod
+    def hand_back(callback: Callable[[socket.socket, object], None], client_socket: socket.socket, state: object):
+        try:
+            callback(client_socket, state)
+        except Exception as e:
+            logging.error(f"Error handing back idle connection: {e}")
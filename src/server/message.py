@@ -1,3 +1,5 @@
+import os
+import threading
 from enum import IntEnum
 from typing import Optional
 
@@ -10,9 +12,30 @@ class MessageType(IntEnum):
     SEND_FILE = 4  # Bonus feature
 
 
+class SharedContent:
+    def __init__(self, data: bytes, refs: int):
+        """
+        Content stored once for a message sent to several recipients
+        Args:
+            data (bytes): Message content (encrypted)
+            refs (int): Number of messages referencing the content
+        """
+        self.data: Optional[bytes] = data
+        self.refs = refs
+        self.lock = threading.Lock()
+
+    def release(self):
+        """Drop one reference, the content is freed when the last recipient fetched it"""
+        with self.lock:
+            self.refs -= 1
+            if self.refs <= 0:
+                self.data = None
+
+
 class Message:
     def __init__(self, ID: int, to_client: bytes, from_client: bytes,
-                 msg_type: int, content: Optional[bytes] = None):
+                 msg_type: int, content: Optional[bytes] = None,
+                 content_file: Optional[str] = None, shared: Optional[SharedContent] = None):
         """
         Initialize a new message
         Args:
@@ -21,6 +44,9 @@ class Message:
             from_client (bytes): 16 bytes (128 bit) sender identifier
             msg_type (int): 1 byte message type
             content (bytes, optional): Message content (encrypted)
+            content_file (str, optional): Spool file holding the content of an uploaded message,
+                                          used instead of content
+            shared (SharedContent, optional): Content shared with other recipients, used instead of content
         """
         if ID < 0 or ID > 0xFFFFFFFF:  # 4 bytes unsigned
             raise ValueError("ID must be a 4 byte unsigned integer")
@@ -30,14 +56,31 @@ class Message:
             raise ValueError("from_client must be 16 bytes")
         if msg_type not in MessageType.__members__.values():
             raise ValueError("Invalid message type")
+        if sum(source is not None for source in (content, content_file, shared)) > 1:
+            raise ValueError("Message content must come from a single source")
 
         self.ID = ID
         self.to_client = to_client
         self.from_client = from_client
         self.type = msg_type
-        self.content = content
+        self._content = content
+        self.content_file = content_file
+        self.shared = shared
+
+    @property
+    def content(self) -> Optional[bytes]:
+        """Message content held in memory, if any"""
+        if self.shared is not None:
+            return self.shared.data
+        return self._content
+
+    def content_size(self) -> int:
+        """Size of the message content in bytes"""
+        if self.content_file is not None:
+            return os.path.getsize(self.content_file)
+        return len(self.content) if self.content else 0
 
     def __str__(self):
         """String representation of the message"""
         return (f"Message(ID={self.ID}, type={MessageType(self.type).name}, "
-                f"content_size={len(self.content) if self.content else 0})")
\ No newline at end of file
+                f"content_size={self.content_size()})")
\ No newline at end of file
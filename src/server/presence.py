@@ -0,0 +1,41 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
+
+class PresenceIndex:
+    def __init__(self):
+        """
+        Clients ordered by their last activity, so marking a client active is O(1)
+        and listing the recently active clients only visits those
+        """
+        self.last_active: 'OrderedDict[bytes, float]' = OrderedDict()  # Client ID -> monotonic time, oldest first
+        self.lock = threading.Lock()
+
+    def touch(self, client_id: bytes):
+        """Mark a client active now"""
+        now = time.monotonic()
+        with self.lock:
+            self.last_active[client_id] = now
+            self.last_active.move_to_end(client_id)
+
+    def active_within(self, window: float) -> List[Tuple[bytes, float]]:
+        """
+        Clients active within the last window seconds
+
+        Returns:
+            list: (client ID, seconds since the last activity), most recently active first
+        """
+        now = time.monotonic()
+        active = []
+        with self.lock:
+            for client_id in reversed(self.last_active):
+                idle = now - self.last_active[client_id]
+                if idle > window:
+                    break
+                active.append((client_id, idle))
+        return active
+
+    def __len__(self):
+        return len(self.last_active)
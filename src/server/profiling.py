@@ -0,0 +1,233 @@
+# src/server/profiling.py
+
+import io
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from pathlib import Path
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional
+
+_local = threading.local()
+
+
+class RequestTrace:
+    """Timings of the phases of a single request, used by the slow request log"""
+    PHASES = ('recv', 'parse', 'lock_wait', 'handler', 'send')
+
+    def __init__(self):
+        self.code: Optional[int] = None
+        self.start = time.perf_counter()
+        self.timings: Dict[str, float] = dict.fromkeys(self.PHASES, 0.0)
+
+    def add(self, phase: str, seconds: float):
+        """Add time spent in a phase"""
+        self.timings[phase] += seconds
+
+    def total(self) -> float:
+        """Seconds since the request started"""
+        return time.perf_counter() - self.start
+
+    def __str__(self):
+        """String representation of the timings in milliseconds"""
+        phases = ", ".join(f"{name}={seconds * 1000:.2f}ms" for name, seconds in self.timings.items())
+        return f"RequestTrace(code={self.code}, total={self.total() * 1000:.2f}ms, {phases})"
+
+
+def set_current_trace(trace: Optional[RequestTrace]):
+    """Attach a trace to the current thread (None detaches)"""
+    _local.trace = trace
+
+
+def current_trace() -> Optional[RequestTrace]:
+    """Return the trace of the request handled by the current thread, if any"""
+    return getattr(_local, 'trace', None)
+
+
+class TimedLock:
+    """Lock recording the time spent waiting for it in the current request trace"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        trace = current_trace()
+        if trace is None:
+            return self._lock.acquire(blocking, timeout)
+        start = time.perf_counter()
+        acquired = self._lock.acquire(blocking, timeout)
+        trace.add('lock_wait', time.perf_counter() - start)
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class TimedSocket:
+    """Socket wrapper recording recv and send time in a request trace"""
+
+    def __init__(self, sock, trace: RequestTrace):
+        self._sock = sock
+        self._trace = trace
+
+    def recv(self, size: int) -> bytes:
+        start = time.perf_counter()
+        try:
+            return self._sock.recv(size)
+        finally:
+            self._trace.add('recv', time.perf_counter() - start)
+
+    def send(self, data: bytes) -> int:
+        start = time.perf_counter()
+        try:
+            return self._sock.send(data)
+        finally:
+            self._trace.add('send', time.perf_counter() - start)
+
+    def sendall(self, data: bytes):
+        start = time.perf_counter()
+        try:
+            self._sock.sendall(data)
+        finally:
+            self._trace.add('send', time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class Profiler:
+    """
+    On-demand cProfile sessions aggregated per opcode, and tracemalloc snapshots
+
+    cProfile only observes the thread it is enabled in, so each request is profiled
+    in its own handler thread and the results are merged per opcode. One request
+    is profiled at a time; requests arriving while another is profiled run unprofiled.
+    """
+    REPORT_LINES = 20
+
+    def __init__(self, output_dir: Path):
+        self.output_dir = output_dir
+        self.active = False
+        self.stats: Dict[int, pstats.Stats] = {}
+        self.requests: Dict[int, int] = {}  # Profiled request count per opcode
+        self._stats_lock = threading.Lock()
+        self._profile_lock = threading.Lock()
+
+    def start(self) -> str:
+        """Start a profiling session, discarding the results of the previous one"""
+        with self._stats_lock:
+            self.stats = {}
+            self.requests = {}
+            self.active = True
+        logging.info("Profiling started")
+        return "Profiling started"
+
+    def stop(self) -> str:
+        """
+        Stop the profiling session and dump the stats of each opcode to the output directory
+
+        Returns:
+            str: Summary of the top functions per opcode
+        """
+        with self._stats_lock:
+            self.active = False
+            stats, requests = self.stats, self.requests
+            self.stats, self.requests = {}, {}
+
+        if not stats:
+            return "Profiling stopped, no requests were profiled"
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        report = io.StringIO()
+        for code in sorted(stats):
+            path = self.output_dir / f"profile-{timestamp}-{code}.pstats"
+            stats[code].dump_stats(path)
+            report.write(f"=== opcode {code}: {requests[code]} requests, stats in {path}\n")
+            stats[code].stream = report
+            stats[code].sort_stats('cumulative').print_stats(self.REPORT_LINES)
+
+        logging.info(f"Profiling stopped, stats written to {self.output_dir}")
+        return report.getvalue()
+
+    def toggle(self, signum=None, frame=None):
+        """Signal handler starting or stopping a profiling session"""
+        if self.active:
+            logging.info(self.stop())
+        else:
+            self.start()
+
+    @contextmanager
+    def profile_request(self, code: int):
+        """Profile the enclosed request handling if a session is active"""
+        if not self.active or not self._profile_lock.acquire(blocking=False):
+            yield
+            return
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+        finally:
+            self._profile_lock.release()
+
+        with self._stats_lock:
+            if not self.active:
+                return
+            if code in self.stats:
+                self.stats[code].add(profile)
+            else:
+                self.stats[code] = pstats.Stats(profile)
+            self.requests[code] = self.requests.get(code, 0) + 1
+
+    @staticmethod
+    def start_tracemalloc(frames: int = 10) -> str:
+        """Start tracing memory allocations"""
+        if tracemalloc.is_tracing():
+            return "tracemalloc already running"
+        tracemalloc.start(frames)
+        logging.info("tracemalloc started")
+        return "tracemalloc started"
+
+    @staticmethod
+    def stop_tracemalloc() -> str:
+        """Stop tracing memory allocations and free the traces"""
+        tracemalloc.stop()
+        logging.info("tracemalloc stopped")
+        return "tracemalloc stopped"
+
+    def tracemalloc_report(self) -> str:
+        """
+        Take a tracemalloc snapshot
+
+        Returns:
+            str: The top allocation sites by size
+        """
+        if not tracemalloc.is_tracing():
+            return "tracemalloc is not running"
+
+        # Leave out the profiling machinery itself
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, cProfile.__file__),
+            tracemalloc.Filter(False, pstats.__file__),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Traced memory: current={current} bytes, peak={peak} bytes"]
+        for stat in snapshot.statistics('lineno')[:self.REPORT_LINES]:
+            lines.append(str(stat))
+        return "\n".join(lines) + "\n"
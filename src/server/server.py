@@ -1,92 +1,549 @@
 # src/server/server.py
 
+import os
+import sys
+import signal
+import select
 import socket
+import argparse
+import subprocess
 import threading
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 import uuid
 import logging
 import struct
+import time
+import itertools
+from pathlib import Path
 from datetime import datetime
 
 from server_config import ServerConfig
 from user import User
-from message import Message, MessageType
+from message import Message, MessageType, SharedContent
+from group import Group
+from upload import UploadSession
+from dedupe import DedupeTable
+from presence import PresenceIndex
+import cluster
+import upgrade
+import profiling
+import capture
+import idle
 
 class MessageUServer:
     VERSION = 1
+    ACCEPT_POLL_INTERVAL = 1.0  # Seconds between checks of the running flag
+    HANDOFF_TIMEOUT = 30.0  # Seconds to wait for the new process during an upgrade
+    DRAIN_POLL_INTERVAL = 0.5  # Seconds between shutting down connections that started waiting during a drain
+    DRAIN_GRACE = 5.0  # Seconds handlers get to finish once their connections were shut down
+    EXPIRY_INTERVAL = 60.0  # Seconds between checks for abandoned uploads
 
-    def __init__(self):
-        """Initialize the server"""
-        self.port = ServerConfig.read_port()
+    def __init__(self, listen_socket: Optional[socket.socket] = None):
+        """
+        Initialize the server
+
+        Args:
+            listen_socket: Already listening socket inherited from a previous process (optional)
+        """
+        self.config = ServerConfig.load()
+        self.port = self.config.port
         self.clients: Dict[bytes, User] = {}  # Map User ID to User object
         self.messages: List[Message] = []  # List of pending messages
-        self.lock = threading.Lock()  # Lock for thread safety
+        self.lock = profiling.TimedLock()  # Lock for thread safety, records wait time for slow request traces
+        self.uploads: Dict[int, UploadSession] = {}  # Map upload ID to unfinished chunked upload
+        self.groups: Dict[bytes, Group] = {}  # Map group ID to Group object
+        self.presence = PresenceIndex()  # Clients ordered by last activity
+        self.sent_nonces = DedupeTable(self.config.dedupe_entries, self.config.dedupe_ttl)  # Idempotent sends
+        self.next_upload_id = 1
+        self.next_message_id = 1  # Never reused, so a retried send or a client cannot confuse two messages
+        self.next_expiry = time.monotonic() + self.EXPIRY_INTERVAL
+        self.spool_dir = Path(__file__).parent / self.config.spool_dir
+
+        self.cluster: Optional[cluster.Cluster] = None  # Set in cluster mode
+        if self.config.cluster_nodes:
+            self.cluster = cluster.Cluster(self.config.cluster_node_id,
+                                           cluster.parse_nodes(self.config.cluster_nodes))
+
+        self.server_socket = listen_socket
+        self.running = False
+        self.reload_requested = False  # Set by SIGHUP, applied by the accept loop
+        self.active_connections = 0  # Connections currently being handled
+        self.active_cond = threading.Condition()
+        self.open_sockets = set()  # Every accepted connection not closed yet
+        self.idle_sockets = set()  # Connections waiting for their next request header
+        self.handoff_conn: Optional[socket.socket] = None  # Set once a new process is ready to take over
+        self.executor: Optional[ThreadPoolExecutor] = None  # Worker pool when max_workers is configured
+        self.idle_poller: Optional[idle.IdlePoller] = None  # Holds the pool's connections between requests
+        self.profiler = profiling.Profiler(Path(__file__).parent / self.config.profile_dir)
+        self.connection_ids = itertools.count(1)  # Identify connections in the traffic capture
+        self.capture: Optional[capture.TrafficCapture] = None  # Set while capture_file is configured
+        self.configure_capture()
 
     def start(self):
         """Start the server and listen for connections"""
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_socket.bind(('127.0.0.1', self.port))
-        server_socket.listen()
+        if self.server_socket is None:
+            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # Allow restarting on the same port while old connections are in TIME_WAIT
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server_socket.bind((self.config.bind_address, self.port))
+            self.server_socket.listen(self.config.backlog)
+            logging.info(f"Server starting on {self.config.bind_address}:{self.port}")
+        else:
+            logging.info(f"Server resuming on inherited socket {self.server_socket.getsockname()}")
+
+        # Poll so an upgrade can stop the accept loop without closing the socket
+        self.server_socket.settimeout(self.ACCEPT_POLL_INTERVAL)
+        self.running = True
 
-        logging.info(f"Server starting on port {self.port}")
+        if self.config.max_workers > 0:
+            self.executor = ThreadPoolExecutor(max_workers=self.config.max_workers)
+            self.idle_poller = idle.IdlePoller(self.resume_client, self.expire_client)
 
-        while True:
+        while self.running:
             try:
-                client_socket, address = server_socket.accept()
+                client_socket, address = self.server_socket.accept()
                 logging.info(f"New connection from {address}")
 
-                # Handle each client in a separate thread
-                client_thread = threading.Thread(
-                    target=self.handle_client,
-                    args=(client_socket,)
-                )
-                client_thread.start()
+                self.configure_client_socket(client_socket)
+
+                with self.active_cond:
+                    self.active_connections += 1
+                    self.open_sockets.add(client_socket)
 
+                if self.executor is not None:
+                    self.executor.submit(self.handle_client, client_socket)
+                else:
+                    # Handle each client in a separate thread
+                    client_thread = threading.Thread(
+                        target=self.handle_client,
+                        args=(client_socket,)
+                    )
+                    client_thread.start()
+
+            except socket.timeout:
+                pass
             except Exception as e:
                 logging.error(f"Error accepting connection: {e}")
 
-    def handle_client(self, client_socket: socket.socket):
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload_config()
+
+            # Abandoned uploads are discarded even if no new upload is opened
+            if time.monotonic() >= self.next_expiry:
+                self.next_expiry = time.monotonic() + self.EXPIRY_INTERVAL
+                with self.lock:
+                    self.expire_uploads()
+
+            if not self.running and self.handoff_conn is not None:
+                # Keep serving if the new process could not take over
+                self.running = not self.complete_upgrade()
+
+        if self.idle_poller is not None:
+            self.idle_poller.stop()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        self.server_socket.close()
+        if self.capture is not None:
+            self.capture.close()
+
+    def configure_client_socket(self, client_socket: socket.socket):
+        """Apply the configured socket options and timeout to an accepted connection"""
+        if self.config.tcp_nodelay:
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.config.rcvbuf > 0:
+            client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.config.rcvbuf)
+        if self.config.sndbuf > 0:
+            client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.config.sndbuf)
+        client_socket.settimeout(self.config.client_timeout or None)
+
+    def request_reload(self, signum=None, frame=None):
+        """
+        Signal handler asking the accept loop to reload the config
+        The handler runs on the main thread, which may hold the server lock during an upgrade
+        """
+        self.reload_requested = True
+
+    def reload_config(self):
+        """Re-read the config file and apply the hot-reloadable parameters"""
+        changed = self.config.reload()
+        if changed:
+            logging.info(f"Reloaded config, changed: {', '.join(changed)}")
+        else:
+            logging.info("Reloaded config, nothing changed")
+        logging.getLogger().setLevel(self.config.log_level)
+        self.profiler.output_dir = Path(__file__).parent / self.config.profile_dir
+        with self.lock:
+            self.sent_nonces.max_entries = self.config.dedupe_entries
+            self.sent_nonces.ttl = self.config.dedupe_ttl
+        self.configure_capture()
+
+    def configure_capture(self):
+        """Start, stop or switch the traffic capture to match capture_file and capture_redact"""
+        path = Path(__file__).parent / self.config.capture_file if self.config.capture_file else None
+        current = self.capture
+        if current is not None and current.path == path and current.redact == self.config.capture_redact:
+            return
+
+        try:
+            self.capture = capture.TrafficCapture(path, self.config.capture_redact) if path is not None else None
+        except (OSError, ValueError) as e:
+            logging.error(f"Cannot capture traffic to {path}: {e}")
+            self.capture = None
+        if current is not None:
+            current.close()
+        if self.capture is not None:
+            logging.info(f"Capturing traffic to {path} (redaction: {self.capture.redact})")
+
+    def request_upgrade(self, signum=None, frame=None):
+        """
+        Signal handler starting a zero-downtime upgrade
+
+        A new server process is started in the background. Once it is ready,
+        the accept loop stops and the listening socket and state are handed over.
+        """
+        if not upgrade.handoff_supported():
+            logging.error("Upgrade requested but socket handoff is not supported on this platform")
+            return
+        threading.Thread(target=self.prepare_upgrade, daemon=True).start()
+
+    def prepare_upgrade(self):
+        """Start the new server process and wait until it connects for the handoff"""
+        path = upgrade.make_handoff_path()
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        child = None
+        try:
+            listener.bind(path)
+            listener.listen(1)
+            listener.settimeout(self.HANDOFF_TIMEOUT)
+
+            child = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--handoff', path])
+            logging.info(f"Started new server process {child.pid}, waiting for handoff")
+
+            conn, _ = listener.accept()
+            conn.settimeout(self.HANDOFF_TIMEOUT)
+            self.handoff_conn = conn
+            self.running = False
+
+        except Exception as e:
+            logging.error(f"Upgrade aborted: {e}")
+            if child is not None:
+                child.kill()
+        finally:
+            listener.close()
+            if os.path.exists(path):
+                os.unlink(path)
+            os.rmdir(os.path.dirname(path))
+
+    def complete_upgrade(self) -> bool:
+        """
+        Drain in-flight requests and pass the listening socket and state to the new process
+
+        New connections wait in the listen backlog meanwhile, so none are refused.
+
+        Returns:
+            bool: True if the new process took over
+        """
+        conn = self.handoff_conn
+        self.handoff_conn = None
+        try:
+            with self.active_cond:
+                if not self.drain_connections():
+                    return False
+
+            with self.lock:
+                upgrade.send_handoff(conn, self.server_socket, self.clients, self.messages, self.uploads,
+                                     self.groups, self.next_message_id, self.sent_nonces, self.presence)
+
+            logging.info(f"Handed over {len(self.clients)} clients, {len(self.messages)} messages, "
+                         f"{len(self.uploads)} uploads and {len(self.groups)} groups")
+            return True
+
+        except Exception as e:
+            logging.error(f"Handoff failed, continuing to serve: {e}")
+            return False
+        finally:
+            conn.close()
+
+    def drain_connections(self) -> bool:
+        """
+        Wait until every connection is closed, must be called with active_cond held
+        Connections waiting for a request header are shut down, clients reconnect to the new process.
+        After drain_timeout the connections still handling a request are shut down as well.
+
+        Returns:
+            bool: True if all connections were closed
+        """
+        deadline = time.monotonic() + self.config.drain_timeout
+        forced = False
+        if self.active_connections > 0:
+            logging.info(f"Draining {self.active_connections} connections")
+        while self.active_connections > 0:
+            # Repeated, connections may start waiting for their next request while draining
+            self.shutdown_waiting_sockets()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                if forced:
+                    logging.error(f"{self.active_connections} connections did not close after the drain timeout")
+                    return False
+                logging.warning(f"Drain timeout, shutting down {len(self.open_sockets)} connections")
+                for open_socket in self.open_sockets:
+                    self.shutdown_socket(open_socket)
+                deadline = time.monotonic() + self.DRAIN_GRACE
+                forced = True
+                continue
+            self.active_cond.wait(min(remaining, self.DRAIN_POLL_INTERVAL))
+        return True
+
+    def shutdown_waiting_sockets(self):
+        """Shut down the connections waiting for a request header, must be called with active_cond held"""
+        for idle_socket in self.idle_sockets:
+            # A request that already arrived is served before the connection closes
+            if not self.has_pending_data(idle_socket):
+                self.shutdown_socket(idle_socket)
+
+    @staticmethod
+    def shutdown_socket(client_socket: socket.socket):
+        """Shut down a connection so the thread blocked on it returns"""
+        try:
+            client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    @staticmethod
+    def has_pending_data(client_socket: socket.socket) -> bool:
+        """Check without blocking whether a connection has data, or the end of the stream, to read"""
+        if hasattr(select, 'poll'):
+            poller = select.poll()
+            poller.register(client_socket, select.POLLIN)
+            return bool(poller.poll(0))
+        return bool(select.select([client_socket], [], [], 0)[0])
+
+    def restore(self, state: tuple):
+        """
+        Load registry, pending messages, uploads, groups, the next message ID, the idempotency keys
+        and the client activity read from the snapshot of the previous process
+        """
+        with self.lock:
+            (self.clients, self.messages, self.uploads, self.groups, self.next_message_id,
+             self.sent_nonces.senders, self.presence.last_active) = state
+            self.next_upload_id = max((upload_id & 0xFFFFFF for upload_id in self.uploads), default=0) + 1
+        logging.info(f"Restored {len(self.clients)} clients, {len(self.messages)} messages, "
+                     f"{len(self.uploads)} uploads and {len(self.groups)} groups")
+
+    def handle_client(self, client_socket: socket.socket, served: int = 0, connection: Optional[int] = None):
+        """
+        Serve requests on a connection until the client closes it
+        Requests on one connection are handled in order, so clients may pipeline them
+        With a worker pool, a connection without a request to read is parked in the idle poller,
+        which submits it again once the next request arrives
+
+        Args:
+            client_socket: The client's socket connection
+            served: Number of requests already served on the connection
+            connection: Connection number in the traffic capture, assigned on the first call
+        """
+        if connection is None:
+            connection = next(self.connection_ids)
+        parked = False
+        try:
+            while True:
+                # Waiting for a request, an upgrade may close the connection now
+                with self.active_cond:
+                    if served > 0 and not self.running:
+                        break
+                    self.idle_sockets.add(client_socket)
+                    if self.idle_poller is not None and not self.has_pending_data(client_socket):
+                        self.idle_poller.park(client_socket, (served, connection), self.config.client_timeout)
+                        parked = True
+                        return
+                try:
+                    header = self.recv_exact(client_socket, 23)
+                except (socket.timeout, OSError):
+                    header = b''
+                finally:
+                    with self.active_cond:
+                        self.idle_sockets.discard(client_socket)
+
+                if not self.handle_request(client_socket, header, served == 0, connection):
+                    break
+                served += 1
+
+        finally:
+            if not parked:
+                self.close_client(client_socket)
+
+    def resume_client(self, client_socket: socket.socket, state: tuple):
+        """Idle poller callback: the next request of a parked connection arrived"""
+        served, connection = state
+        try:
+            self.executor.submit(self.handle_client, client_socket, served, connection)
+        except RuntimeError:
+            # The pool is shutting down
+            self.close_client(client_socket)
+
+    def expire_client(self, client_socket: socket.socket, state: tuple):
+        """Idle poller callback: a parked connection waited longer than client_timeout"""
+        served, _ = state
+        if served == 0 and self.running:
+            logging.error("No data received")
+        self.close_client(client_socket)
+
+    def close_client(self, client_socket: socket.socket):
+        client_socket.close()
+        with self.active_cond:
+            self.idle_sockets.discard(client_socket)
+            self.open_sockets.discard(client_socket)
+            self.active_connections -= 1
+            self.active_cond.notify_all()
+
+    def handle_request(self, client_socket: socket.socket, header: bytes, first: bool, connection: int = 0) -> bool:
+        """
+        Handle one request whose header was received
+        With capture_file configured, the request and its response size are written to the trace
+
+        Returns:
+            bool: True if the connection can be used for another request
+        """
+        trace = None
+        if self.config.slow_request_ms > 0:
+            trace = profiling.RequestTrace()
+            client_socket = profiling.TimedSocket(client_socket, trace)
+        profiling.set_current_trace(trace)
+        arrival = time.time()
+        arrival_clock = time.perf_counter()
+        traffic_capture = None
+
         try:
-            # logging.info("Waiting to receive data...")
-            header = client_socket.recv(23)
             logging.info(f"Received header data: {header.hex()}, length: {len(header)}")
 
             if not header:
-                logging.error("No data received")
-                return
+                # Connections shut down by an upgrade end without a request as well
+                if first and self.running:
+                    logging.error("No data received")
+                return False
             if len(header) < 23:
                 logging.error(f"Incomplete header received: {len(header)} bytes instead of 23")
-                return
+                return False
 
+            parse_start = time.perf_counter()
             client_id = header[:16]
             version = header[16]
             code = struct.unpack('<H', header[17:19])[0]
             payload_size = struct.unpack('<I', header[19:23])[0]
+            if trace is not None:
+                trace.code = code
+                trace.add('parse', time.perf_counter() - parse_start)
+
+            if payload_size > self.config.max_payload_size:
+                logging.error(f"Payload size {payload_size} exceeds limit of {self.config.max_payload_size}")
+                self.send_error(client_socket)
+                return False
 
             # Read payload if exists
             payload = b''
             if payload_size > 0:
-                payload = client_socket.recv(payload_size)
-
-            # Handle the request based on code
-            if code == 600:
-                self.handle_registration(client_socket, payload)
-            elif code == 601:
-                self.handle_clients_list(client_socket, client_id)
-            elif code == 602:
-                self.handle_public_key(client_socket, client_id, payload)
-            elif code == 603:
-                self.handle_send_message(client_socket, client_id, payload)
-            elif code == 604:
-                self.handle_pending_messages(client_socket, client_id)
-            else:
-                self.send_error(client_socket)
+                payload = self.recv_exact(client_socket, payload_size)
+                if len(payload) < payload_size:
+                    logging.error(f"Incomplete payload received: {len(payload)} bytes instead of {payload_size}")
+                    return False
+
+            # Admin and cluster internal requests are not part of the client traffic
+            traffic_capture = self.capture if code < 700 else None
+            if traffic_capture is not None:
+                client_socket = capture.CaptureSocket(client_socket)
+
+            # Any request of a registered client counts as activity
+            user = self.clients.get(client_id)
+            if user is not None:
+                user.update_last_seen()
+                self.presence.touch(client_id)
+
+            handler_start = time.perf_counter()
+            with self.profiler.profile_request(code):
+                self.dispatch(client_socket, client_id, code, payload)
+            if trace is not None:
+                # Handler time excludes the lock wait and send time recorded separately
+                elapsed = time.perf_counter() - handler_start
+                trace.add('handler', elapsed - trace.timings['lock_wait'] - trace.timings['send'])
+            return True
 
         except Exception as e:
             logging.error(f"Error handling client: {e}")
             self.send_error(client_socket)
+            return False
         finally:
-            client_socket.close()
+            profiling.set_current_trace(None)
+            if traffic_capture is not None:
+                try:
+                    traffic_capture.record(arrival, connection, time.perf_counter() - arrival_clock,
+                                           header, payload, client_socket)
+                except OSError as e:
+                    logging.error(f"Error writing traffic capture: {e}")
+            if trace is not None and trace.code is not None and trace.total() * 1000 >= self.config.slow_request_ms:
+                logging.warning(f"Slow request: {trace}")
+
+    @staticmethod
+    def recv_exact(client_socket: socket.socket, size: int) -> bytes:
+        """Receive size bytes, or fewer if the client closes the connection"""
+        data = bytearray()
+        while len(data) < size:
+            chunk = client_socket.recv(size - len(data))
+            if not chunk:
+                break
+            data.extend(chunk)
+        return bytes(data)
+
+    def dispatch(self, client_socket: socket.socket, client_id: bytes, code: int, payload: bytes,
+                 forwarded: bool = False):
+        """
+        Handle the request based on code
+        In cluster mode, requests concerning a client owned by another node are forwarded to it,
+        unless they were already forwarded by a peer
+        """
+        if self.cluster is not None and code in cluster.ROUTED_CODES and not forwarded:
+            owner = self.cluster.request_owner(code, client_id, payload)
+            if owner != self.cluster.node_id:
+                self.forward_request(client_socket, owner, client_id, code, payload)
+                return
+
+        if code == 600:
+            self.handle_registration(client_socket, payload)
+        elif code == 601:
+            self.handle_clients_list(client_socket, client_id)
+        elif code == 602:
+            self.handle_public_key(client_socket, client_id, payload)
+        elif code == 603:
+            self.handle_send_message(client_socket, client_id, payload)
+        elif code == 604:
+            self.handle_pending_messages(client_socket, client_id, acknowledged=forwarded)
+        elif code == 605:
+            self.handle_upload_open(client_socket, client_id, payload)
+        elif code == 606:
+            self.handle_upload_chunk(client_socket, client_id, payload)
+        elif code == 607:
+            self.handle_upload_status(client_socket, client_id, payload)
+        elif code == 608:
+            self.handle_upload_commit(client_socket, client_id, payload)
+        elif code == 609:
+            self.handle_idempotent_send(client_socket, client_id, payload)
+        elif code == 610:
+            self.handle_create_group(client_socket, client_id, payload)
+        elif code == 611:
+            self.handle_group_membership(client_socket, client_id, payload, add=True)
+        elif code == 612:
+            self.handle_group_membership(client_socket, client_id, payload, add=False)
+        elif code == 613:
+            self.handle_send_to_group(client_socket, client_id, payload)
+        elif code == 614:
+            self.handle_active_peers(client_socket, client_id, payload)
+        elif code == 700:
+            self.handle_admin(client_socket, payload)
+        elif code in (800, 801, 802, 803):
+            self.handle_cluster_request(client_socket, code, payload)
+        else:
+            self.send_error(client_socket)
 
     def handle_registration(self, client_socket: socket.socket, payload: bytes):
         """
@@ -125,22 +582,30 @@ class MessageUServer:
                         self.send_error(client_socket)
                         return
 
-                # Generate new UUID for client
+                # Generate new UUID for client, in a cluster one owned by this node so messages
+                # to the client are routed to a node that knows it even if replication fails
                 client_id = uuid.uuid4().bytes
+                while self.cluster is not None and not self.cluster.is_local(client_id):
+                    client_id = uuid.uuid4().bytes
 
                 # Create and store new user
                 new_user = User(client_id, username, public_key)
                 self.clients[client_id] = new_user
-
-                # Send success response with client ID
-                response = struct.pack('<BHI', self.VERSION, 2100, 16)  # Version, Code, Size
-                response += client_id
-                client_socket.send(response)
+                self.presence.touch(client_id)
 
                 logging.info(f"Registered new user: {username}")
                 logging.info(f"User clientID: {client_id.hex()}")
                 logging.info(f"User Public key : {public_key.hex()[:5]}...{public_key.hex()[-5:]}")
 
+            # Replicate before answering so the client can use any node right away
+            if self.cluster is not None:
+                self.replicate_user(new_user)
+
+            # Send success response with client ID
+            response = struct.pack('<BHI', self.VERSION, 2100, 16)  # Version, Code, Size
+            response += client_id
+            client_socket.send(response)
+
         except Exception as e:
             logging.error(f"Registration error: {e}")
             self.send_error(client_socket)
@@ -210,7 +675,8 @@ class MessageUServer:
             logging.error(f"Error handling public key request: {e}")
             self.send_error(client_socket)
 
-    def handle_send_message(self, client_socket: socket.socket, client_id: bytes, payload: bytes):
+    def handle_send_message(self, client_socket: socket.socket, client_id: bytes, payload: bytes,
+                            nonce: Optional[bytes] = None):
         """
         Handle sending a message between clients (code 603)
 
@@ -219,6 +685,8 @@ class MessageUServer:
             client_id: ID of sending client (16 bytes)
             payload: Contains destination client ID (16 bytes), message type (1 byte),
                     content size (4 bytes) and content (variable size)
+            nonce: Idempotency key of the send (16 bytes, optional), a send repeating the key
+                   of an earlier one gets the original message ID and stores nothing
         """
         try:
             # Validate minimum payload size (16 + 1 + 4 = 21 bytes)
@@ -237,10 +705,19 @@ class MessageUServer:
                     self.send_error(client_socket)
                     return
 
-                # Create and store new message
-                message_id = len(self.messages) + 1  # Simple incrementing ID
-                message = Message(message_id, dest_client_id, client_id, message_type, content)
-                self.messages.append(message)
+                original = self.sent_nonces.get(client_id, nonce) if nonce is not None else None
+                if original is not None:
+                    if original[0] != dest_client_id:
+                        raise ValueError("Idempotency key reused for another destination")
+                    message_id = original[1]
+                    logging.info(f"Repeated send of message {message_id}, not stored again")
+                else:
+                    # Create and store new message
+                    message_id = self.new_message_id()
+                    message = Message(message_id, dest_client_id, client_id, message_type, content)
+                    self.messages.append(message)
+                    if nonce is not None:
+                        self.sent_nonces.record(client_id, nonce, dest_client_id, message_id)
 
                 # Send success response with message ID
                 response = struct.pack('<BHI16sI', self.VERSION, 2103, 20, dest_client_id, message_id)
@@ -250,14 +727,33 @@ class MessageUServer:
             logging.error(f"Error handling send message: {e}")
             self.send_error(client_socket)
 
-    def handle_pending_messages(self, client_socket: socket.socket, client_id: bytes):
+    def handle_idempotent_send(self, client_socket: socket.socket, client_id: bytes, payload: bytes):
+        """
+        Handle sending a message with an idempotency key (code 609)
+        Retries with the same key return the original message ID (code 2103)
+
+        Args:
+            client_socket: The client's socket connection
+            client_id: ID of sending client (16 bytes)
+            payload: Contains the idempotency key (16 bytes) followed by a 603 payload
+        """
+        if len(payload) < 16:
+            logging.error(f"Invalid idempotent send payload length: {len(payload)}")
+            self.send_error(client_socket)
+            return
+        self.handle_send_message(client_socket, client_id, payload[16:], nonce=payload[:16])
+
+    def handle_pending_messages(self, client_socket: socket.socket, client_id: bytes, acknowledged: bool = False):
         """
         Handle request for pending messages (code 604)
         Returns all pending messages for the requesting client
+        Uploaded contents are streamed from their spool files in chunks
 
         Args:
             client_socket: The client's socket connection
             client_id: ID of requesting client (16 bytes)
+            acknowledged: The request was forwarded by a peer node, which confirms with one byte (1)
+                          that it relayed the response; the messages are kept until then
         """
         try:
             with self.lock:
@@ -277,34 +773,562 @@ class MessageUServer:
                     client_socket.send(response)
                     return
 
-                # Build response payload for all pending messages
-                payload = bytearray()
-                for msg in pending_messages:
-                    # Add sender client ID (16 bytes)
-                    payload.extend(msg.from_client)
-                    # Add message ID (4 bytes)
-                    payload.extend(struct.pack('<I', msg.ID))
-                    # Add message type (1 byte)
-                    payload.extend(bytes([msg.type]))
-                    # Add content size (4 bytes)
-                    content_size = len(msg.content) if msg.content else 0
-                    payload.extend(struct.pack('<I', content_size))
-                    # Add content if exists
-                    if msg.content:
-                        payload.extend(msg.content)
-
-                # Send response with all pending messages
-                response = struct.pack('<BHI', self.VERSION, 2104, len(payload))
-                response += payload
-                client_socket.send(response)
-
-                # Update messages list to remove sent messages
+                # Take the messages out of the list so the lock is not held while sending
                 self.messages = remaining_messages
 
+            try:
+                self.send_pending_messages(client_socket, pending_messages)
+                if acknowledged and self.recv_exact(client_socket, 1) != b'\x01':
+                    raise ConnectionError("The forwarding node did not confirm the relay")
+            except Exception as e:
+                # Keep the messages for the next request
+                with self.lock:
+                    self.messages = pending_messages + self.messages
+                if acknowledged:
+                    # The response was sent, an error response would be read as the next one
+                    logging.error(f"Forwarded pending messages not delivered, kept: {e}")
+                    self.shutdown_socket(client_socket)
+                    return
+                raise
+
+            for msg in pending_messages:
+                if msg.content_file is not None:
+                    os.unlink(msg.content_file)
+                elif msg.shared is not None:
+                    msg.shared.release()
+
         except Exception as e:
             logging.error(f"Error handling pending messages: {e}")
             self.send_error(client_socket)
 
+    def send_pending_messages(self, client_socket: socket.socket, pending_messages: List[Message]):
+        """Send the 2104 response for the given messages"""
+        sizes = [msg.content_size() for msg in pending_messages]
+        total_size = sum(sizes) + 25 * len(pending_messages)
+
+        # Build response payload for all pending messages
+        payload = bytearray(struct.pack('<BHI', self.VERSION, 2104, total_size))
+        for msg, content_size in zip(pending_messages, sizes):
+            # Add sender client ID (16 bytes)
+            payload.extend(msg.from_client)
+            # Add message ID (4 bytes)
+            payload.extend(struct.pack('<I', msg.ID))
+            # Add message type (1 byte)
+            payload.extend(bytes([msg.type]))
+            # Add content size (4 bytes)
+            payload.extend(struct.pack('<I', content_size))
+            # Add content if exists
+            if msg.content:
+                payload.extend(msg.content)
+            elif msg.content_file is not None:
+                client_socket.sendall(payload)
+                payload = bytearray()
+                with open(msg.content_file, 'rb') as f:
+                    while chunk := f.read(self.config.upload_chunk_size):
+                        client_socket.sendall(chunk)
+
+        client_socket.sendall(payload)
+
+    def handle_upload_open(self, client_socket: socket.socket, client_id: bytes, payload: bytes):
+        """
+        Handle opening a chunked upload of a message content (code 605)
+        Returns upload ID (4 bytes) and maximum chunk size (4 bytes) (code 2105)
+
+        Args:
+            client_socket: The client's socket connection
+            client_id: ID of uploading client (16 bytes)
+            payload: Contains destination client ID (16 bytes), message type (1 byte)
+                    and total content size (4 bytes)
+        """
+        try:
+            if len(payload) != 21:
+                raise ValueError(f"Invalid payload length: {len(payload)}")
+
+            dest_client_id = payload[:16]
+            message_type = payload[16]
+            total_size = struct.unpack('<I', payload[17:21])[0]
+            if message_type not in MessageType.__members__.values():
+                raise ValueError(f"Invalid message type: {message_type}")
+
+            with self.lock:
+                if dest_client_id not in self.clients:
+                    self.send_error(client_socket)
+                    return
+
+                self.expire_uploads()
+
+                # The top byte holds the node index so upload requests can be routed in a cluster
+                node_index = self.cluster.node_index if self.cluster is not None else 0
+                upload_id = (node_index << 24) | (self.next_upload_id & 0xFFFFFF)
+                self.next_upload_id += 1
+                self.spool_dir.mkdir(parents=True, exist_ok=True)
+                path = self.spool_dir / f"upload-{uuid.uuid4().hex}"
+                path.touch()
+                self.uploads[upload_id] = UploadSession(upload_id, client_id, dest_client_id,
+                                                        message_type, total_size, path)
+
+            response = struct.pack('<BHIII', self.VERSION, 2105, 8, upload_id, self.config.upload_chunk_size)
+            client_socket.send(response)
+            logging.info(f"Opened upload {upload_id} of {total_size} bytes")
+
+        except Exception as e:
+            logging.error(f"Error opening upload: {e}")
+            self.send_error(client_socket)
+
+    def handle_upload_chunk(self, client_socket: socket.socket, client_id: bytes, payload: bytes):
+        """
+        Handle a chunk of an upload (code 606)
+        Returns upload ID (4 bytes) and received size (4 bytes) (code 2106)
+
+        Args:
+            client_socket: The client's socket connection
+            client_id: ID of uploading client (16 bytes)
+            payload: Contains upload ID (4 bytes), chunk offset (4 bytes) and chunk data
+        """
+        try:
+            if len(payload) < 8:
+                raise ValueError(f"Invalid payload length: {len(payload)}")
+
+            upload_id, offset = struct.unpack('<II', payload[:8])
+            data = payload[8:]
+            if len(data) > self.config.upload_chunk_size:
+                raise ValueError(f"Chunk of {len(data)} bytes exceeds {self.config.upload_chunk_size}")
+
+            session = self.get_upload(client_id, upload_id)
+            # The session serializes its own chunks, no need to hold the server lock
+            session.write_chunk(offset, data)
+
+            response = struct.pack('<BHIII', self.VERSION, 2106, 8, upload_id, session.received)
+            client_socket.send(response)
+
+        except Exception as e:
+            logging.error(f"Error handling upload chunk: {e}")
+            self.send_error(client_socket)
+
+    def handle_upload_status(self, client_socket: socket.socket, client_id: bytes, payload: bytes):
+        """
+        Handle a query of the received size of an upload, used to resume it (code 607)
+        Returns upload ID (4 bytes) and received size (4 bytes) (code 2106)
+
+        Args:
+            client_socket: The client's socket connection
+            client_id: ID of uploading client (16 bytes)
+            payload: Contains upload ID (4 bytes)
+        """
+        try:
+            if len(payload) != 4:
+                raise ValueError(f"Invalid payload length: {len(payload)}")
+
+            upload_id = struct.unpack('<I', payload)[0]
+            session = self.get_upload(client_id, upload_id)
+
+            response = struct.pack('<BHIII', self.VERSION, 2106, 8, upload_id, session.received)
+            client_socket.send(response)
+
+        except Exception as e:
+            logging.error(f"Error handling upload status: {e}")
+            self.send_error(client_socket)
+
+    def handle_upload_commit(self, client_socket: socket.socket, client_id: bytes, payload: bytes):
+        """
+        Handle committing a complete upload as a message (code 608)
+        Returns the same response as sending a message (code 2103)
+
+        Args:
+            client_socket: The client's socket connection
+            client_id: ID of uploading client (16 bytes)
+            payload: Contains upload ID (4 bytes)
+        """
+        try:
+            if len(payload) != 4:
+                raise ValueError(f"Invalid payload length: {len(payload)}")
+
+            upload_id = struct.unpack('<I', payload)[0]
+            session = self.get_upload(client_id, upload_id)
+            if not session.is_complete():
+                raise ValueError(f"Upload incomplete: {session}")
+
+            with self.lock:
+                del self.uploads[upload_id]
+
+                # Create and store new message backed by the spool file
+                message_id = self.new_message_id()
+                message = Message(message_id, session.to_client, client_id, session.type,
+                                  content_file=str(session.path))
+                self.messages.append(message)
+
+            response = struct.pack('<BHI16sI', self.VERSION, 2103, 20, session.to_client, message_id)
+            client_socket.send(response)
+            logging.info(f"Committed upload {upload_id} as message {message_id}")
+
+        except Exception as e:
+            logging.error(f"Error committing upload: {e}")
+            self.send_error(client_socket)
+
+    def handle_create_group(self, client_socket: socket.socket, client_id: bytes, payload: bytes):
+        """
+        Handle creating a group (code 610), the requesting client becomes its owner and first member
+        Returns the group ID (16 bytes) (code 2110)
+
+        Args:
+            client_socket: The client's socket connection
+            client_id: ID of requesting client (16 bytes)
+            payload: Group name (255 bytes, null terminated)
+        """
+        try:
+            if len(payload) != 255:
+                raise ValueError(f"Invalid payload length: {len(payload)}")
+
+            null_pos = payload.find(b'\x00')
+            if null_pos == -1:
+                raise ValueError("No null terminator in group name")
+            name = payload[:null_pos].decode('ascii')
+
+            with self.lock:
+                if client_id not in self.clients:
+                    self.send_error(client_socket)
+                    return
+
+                # In a cluster the group must hash to this node, where its requests are routed
+                group_id = uuid.uuid4().bytes
+                while self.cluster is not None and not self.cluster.is_local(group_id):
+                    group_id = uuid.uuid4().bytes
+
+                self.groups[group_id] = Group(group_id, name, client_id)
+
+            response = struct.pack('<BHI16s', self.VERSION, 2110, 16, group_id)
+            client_socket.send(response)
+            logging.info(f"Created group {name}: {group_id.hex()}")
+
+        except Exception as e:
+            logging.error(f"Error creating group: {e}")
+            self.send_error(client_socket)
+
+    def handle_group_membership(self, client_socket: socket.socket, client_id: bytes, payload: bytes, add: bool):
+        """
+        Handle adding (code 611) or removing (code 612) a group member
+        Only the owner adds members; the owner or the member itself removes one
+        Returns group ID (16 bytes) and member count (4 bytes) (code 2111)
+
+        Args:
+            client_socket: The client's socket connection
+            client_id: ID of requesting client (16 bytes)
+            payload: Group ID (16 bytes) and member client ID (16 bytes)
+        """
+        try:
+            if len(payload) != 32:
+                raise ValueError(f"Invalid payload length: {len(payload)}")
+
+            group_id = payload[:16]
+            member_id = payload[16:32]
+
+            with self.lock:
+                group = self.groups.get(group_id)
+                if group is None:
+                    raise KeyError(f"Unknown group {group_id.hex()}")
+
+                if add:
+                    if client_id != group.owner:
+                        raise PermissionError("Only the group owner adds members")
+                    if member_id not in self.clients:
+                        raise KeyError(f"Unknown client {member_id.hex()}")
+                    group.members.add(member_id)
+                else:
+                    if client_id not in (group.owner, member_id):
+                        raise PermissionError("Only the group owner or the member itself removes a member")
+                    if member_id == group.owner:
+                        raise ValueError("The group owner cannot be removed")
+                    group.members.discard(member_id)
+
+                member_count = len(group.members)
+
+            response = struct.pack('<BHI16sI', self.VERSION, 2111, 20, group_id, member_count)
+            client_socket.send(response)
+
+        except Exception as e:
+            logging.error(f"Error changing group membership: {e}")
+            self.send_error(client_socket)
+
+    def handle_send_to_group(self, client_socket: socket.socket, client_id: bytes, payload: bytes):
+        """
+        Handle sending a message to every other member of a group (code 613)
+        The content is stored once and each member's mailbox gets a reference to it
+        Returns group ID (16 bytes), the number of members the message was delivered to (4 bytes)
+        and the IDs (16 bytes each) of the members whose node could not be reached (code 2113),
+        so a client does not send the message again to the members that have it
+
+        Args:
+            client_socket: The client's socket connection
+            client_id: ID of sending client, must be a member (16 bytes)
+            payload: Contains group ID (16 bytes), message type (1 byte),
+                    content size (4 bytes) and content (variable size)
+        """
+        try:
+            if len(payload) < 21:
+                raise ValueError(f"Invalid payload length: {len(payload)}")
+
+            group_id = payload[:16]
+            message_type = payload[16]
+            content_size = struct.unpack('<I', payload[17:21])[0]
+            content = payload[21:21 + content_size] if content_size > 0 else None
+            if message_type not in MessageType.__members__.values():
+                raise ValueError(f"Invalid message type: {message_type}")
+
+            with self.lock:
+                group = self.groups.get(group_id)
+                if group is None or client_id not in group.members:
+                    self.send_error(client_socket)
+                    return
+                recipients = [member for member in group.members if member != client_id]
+
+            # In a cluster, members owned by other nodes get the content through one request per node
+            local_recipients = recipients
+            remote: Dict[str, List[bytes]] = {}
+            if self.cluster is not None:
+                local_recipients = []
+                for member in recipients:
+                    node = self.cluster.ring.owner(member)
+                    if node == self.cluster.node_id:
+                        local_recipients.append(member)
+                    else:
+                        remote.setdefault(node, []).append(member)
+
+            self.deliver_shared(client_id, message_type, local_recipients, content)
+
+            undelivered = []
+            for node, members in remote.items():
+                try:
+                    self.deliver_remote(node, client_id, message_type, members, content)
+                except Exception as e:
+                    logging.error(f"Group message not delivered to {len(members)} members on node {node}: {e}")
+                    undelivered.extend(members)
+
+            response = struct.pack('<BHI16sI', self.VERSION, 2113, 20 + 16 * len(undelivered), group_id,
+                                   len(recipients) - len(undelivered))
+            client_socket.send(response + b''.join(undelivered))
+
+        except Exception as e:
+            logging.error(f"Error handling send to group: {e}")
+            self.send_error(client_socket)
+
+    def deliver_shared(self, from_client: bytes, message_type: int, recipients: List[bytes],
+                       content: Optional[bytes]):
+        """Enqueue one message per recipient, all referencing a single copy of the content"""
+        if not recipients:
+            return
+        shared = SharedContent(content, len(recipients)) if content else None
+        with self.lock:
+            for member in recipients:
+                self.messages.append(Message(self.new_message_id(), member, from_client, message_type, shared=shared))
+
+    def new_message_id(self) -> int:
+        """Assign the next message ID, must be called with the lock held"""
+        message_id = self.next_message_id
+        # IDs are sent as 4 bytes, 0 is skipped when wrapping around
+        self.next_message_id = self.next_message_id % 0xFFFFFFFF + 1
+        return message_id
+
+    def deliver_remote(self, node: str, from_client: bytes, message_type: int, recipients: List[bytes],
+                       content: Optional[bytes]):
+        """Send a group message to the members owned by another node (code 803)"""
+        content = content or b''
+        payload = (from_client + struct.pack('<BI', message_type, len(recipients)) + b''.join(recipients)
+                   + content)
+        response_code, _ = self.cluster.request(node, 803, payload)
+        if response_code != 2803:
+            raise ConnectionError(f"Node {node} did not accept the group message")
+
+    def handle_active_peers(self, client_socket: socket.socket, client_id: bytes, payload: bytes):
+        """
+        Handle request for the peers active within a window (code 614)
+        Returns client ID (16 bytes) and seconds since the last request (4 bytes) of every other client
+        active within the window, most recently active first (code 2114)
+
+        Args:
+            client_socket: The client's socket connection
+            client_id: ID of requesting client (16 bytes)
+            payload: Window in seconds (4 bytes)
+        """
+        try:
+            if len(payload) != 4:
+                raise ValueError(f"Invalid payload length: {len(payload)}")
+            window = struct.unpack('<I', payload)[0]
+
+            response_payload = bytearray()
+            for peer_id, idle_seconds in self.presence.active_within(window):
+                if peer_id != client_id:
+                    response_payload.extend(peer_id)
+                    response_payload.extend(struct.pack('<I', int(idle_seconds)))
+
+            response = struct.pack('<BHI', self.VERSION, 2114, len(response_payload)) + response_payload
+            client_socket.send(response)
+            logging.info(f"Sent {len(response_payload) // 20} active peers within {window} seconds")
+
+        except Exception as e:
+            logging.error(f"Error handling active peers request: {e}")
+            self.send_error(client_socket)
+
+    def get_upload(self, client_id: bytes, upload_id: int) -> UploadSession:
+        """Look up an upload, which must belong to the requesting client"""
+        with self.lock:
+            session = self.uploads.get(upload_id)
+        if session is None or session.owner != client_id:
+            raise KeyError(f"Unknown upload {upload_id}")
+        return session
+
+    def expire_uploads(self):
+        """Discard uploads idle for longer than upload_timeout, must be called with the lock held"""
+        for upload_id, session in list(self.uploads.items()):
+            if session.idle_time() > self.config.upload_timeout:
+                logging.info(f"Discarding expired upload {session}")
+                session.discard()
+                del self.uploads[upload_id]
+
+    def forward_request(self, client_socket: socket.socket, node: str, client_id: bytes,
+                        code: int, payload: bytes):
+        """
+        Forward a request to the node owning it (wrapped in code 802) and relay the response
+        The response payload is copied in chunks, so large 604 responses are not buffered.
+        A relayed 604 response is confirmed to the owner, which keeps the messages until then.
+        """
+        try:
+            inner = struct.pack('<16sBHI', client_id, self.VERSION, code, len(payload)) + payload
+            conn, header = self.cluster.open_request(node, 802, inner, client_id)
+            try:
+                client_socket.sendall(header)
+
+                response_code, size = struct.unpack('<HI', header[1:7])
+                remaining = size
+                while remaining > 0:
+                    chunk = cluster.recv_exact(conn, min(self.config.upload_chunk_size, remaining))
+                    client_socket.sendall(chunk)
+                    remaining -= len(chunk)
+
+                if code == 604 and response_code == 2104 and size > 0:
+                    conn.sendall(b'\x01')
+            except Exception:
+                conn.close()
+                raise
+            self.cluster.release(node, conn)
+
+        except Exception as e:
+            logging.error(f"Error forwarding request {code} to node {node}: {e}")
+            self.send_error(client_socket)
+
+    def handle_cluster_request(self, client_socket: socket.socket, code: int, payload: bytes):
+        """
+        Handle an internal request from a peer node
+        800: replicate a user, payload is ID (16 bytes), username (255 bytes) and public key (160 bytes)
+        801: registry sync, returns every user in the 800 layout (code 2801)
+        802: forwarded request, payload is the original header (23 bytes) and payload;
+             the forwarding node confirms a non-empty 604 response with one byte (1) once relayed
+        803: group message delivery, payload is sender ID (16 bytes), message type (1 byte),
+             recipient count (4 bytes), recipient IDs (16 bytes each) and content
+        """
+        try:
+            if self.cluster is None:
+                raise PermissionError("Cluster request on a standalone server")
+            if not self.cluster.is_peer_address(client_socket.getpeername()[0]):
+                raise PermissionError(f"Cluster request from unknown address {client_socket.getpeername()[0]}")
+
+            if code == 800:
+                if len(payload) != 431:
+                    raise ValueError(f"Invalid payload length: {len(payload)}")
+                user = self.decode_user(payload)
+                with self.lock:
+                    self.clients.setdefault(user.ID, user)
+                client_socket.send(struct.pack('<BHI', self.VERSION, 2800, 0))
+
+            elif code == 801:
+                with self.lock:
+                    users = b''.join(self.encode_user(user) for user in self.clients.values())
+                client_socket.sendall(struct.pack('<BHI', self.VERSION, 2801, len(users)) + users)
+
+            elif code == 803:
+                if len(payload) < 21:
+                    raise ValueError(f"Invalid payload length: {len(payload)}")
+                message_type, count = struct.unpack('<BI', payload[16:21])
+                end = 21 + count * 16
+                recipients = [payload[offset:offset + 16] for offset in range(21, end, 16)]
+                self.deliver_shared(payload[:16], message_type, recipients, payload[end:] or None)
+                client_socket.send(struct.pack('<BHI', self.VERSION, 2803, 0))
+
+            else:
+                if len(payload) < 23:
+                    raise ValueError(f"Invalid payload length: {len(payload)}")
+                client_id = payload[:16]
+                inner_code, size = struct.unpack('<HI', payload[17:23])
+                self.dispatch(client_socket, client_id, inner_code, payload[23:23 + size], forwarded=True)
+
+        except Exception as e:
+            logging.error(f"Error handling cluster request {code}: {e}")
+            self.send_error(client_socket)
+
+    @staticmethod
+    def encode_user(user: User) -> bytes:
+        """Encode a user as ID (16 bytes), null padded username (255 bytes) and public key (160 bytes)"""
+        return user.ID + user.username.encode('ascii').ljust(255, b'\x00') + user.public_key
+
+    @staticmethod
+    def decode_user(data: bytes) -> User:
+        """Decode a user encoded by encode_user"""
+        username = data[16:271].split(b'\x00')[0].decode('ascii')
+        return User(data[:16], username, data[271:431])
+
+    def replicate_user(self, user: User):
+        """Send a newly registered user to the other nodes"""
+        failed = self.cluster.broadcast(800, self.encode_user(user))
+        if failed:
+            logging.warning(f"Could not replicate user {user.username} to nodes: {', '.join(failed)}")
+
+    def sync_registry(self):
+        """Load the registry from a peer node, used when a node (re)joins the cluster"""
+        users = self.cluster.first_peer_response(801, b'')
+        if users is None:
+            logging.warning("No cluster node answered the registry sync")
+            return
+        with self.lock:
+            for offset in range(0, len(users), 431):
+                user = self.decode_user(users[offset:offset + 431])
+                self.clients.setdefault(user.ID, user)
+        logging.info(f"Synced registry from cluster, {len(self.clients)} clients known")
+
+    def handle_admin(self, client_socket: socket.socket, payload: bytes):
+        """
+        Handle an admin request (code 700), only accepted from loopback when admin_opcodes is enabled
+        Returns a text report (code 2700)
+
+        Args:
+            client_socket: The client's socket connection
+            payload: Action (1 byte): 1 start profiling, 2 stop profiling and dump stats,
+                     3 start tracemalloc, 4 tracemalloc snapshot, 5 stop tracemalloc
+        """
+        try:
+            if not self.config.admin_opcodes:
+                raise PermissionError("Admin opcodes are disabled")
+            if client_socket.getpeername()[0] not in ('127.0.0.1', '::1'):
+                raise PermissionError(f"Admin request from non-local address {client_socket.getpeername()[0]}")
+            if len(payload) != 1:
+                raise ValueError(f"Invalid payload length: {len(payload)}")
+
+            actions = {
+                1: self.profiler.start,
+                2: self.profiler.stop,
+                3: self.profiler.start_tracemalloc,
+                4: self.profiler.tracemalloc_report,
+                5: self.profiler.stop_tracemalloc,
+            }
+            if payload[0] not in actions:
+                raise ValueError(f"Unknown admin action: {payload[0]}")
+
+            report = actions[payload[0]]().encode('utf-8')
+            response = struct.pack('<BHI', self.VERSION, 2700, len(report)) + report
+            client_socket.sendall(response)
+
+        except Exception as e:
+            logging.error(f"Error handling admin request: {e}")
+            self.send_error(client_socket)
+
     def send_error(self, client_socket: socket.socket):
         """Send error response to client"""
         response = struct.pack('<BHI', self.VERSION, 9000, 0)
@@ -317,8 +1341,36 @@ def main():
         format='%(asctime)s - %(levelname)s - %(message)s'
     )
 
+    parser = argparse.ArgumentParser(description="MessageU server")
+    parser.add_argument('--handoff', metavar='PATH',
+                        help="Take over the listening socket and state of a running server")
+    args = parser.parse_args()
+
     # Start server
-    server = MessageUServer()
+    if args.handoff:
+        listen_socket, state = upgrade.receive_handoff(args.handoff)
+        server = MessageUServer(listen_socket)
+        server.restore(state)
+    else:
+        server = MessageUServer()
+    logging.getLogger().setLevel(server.config.log_level)
+
+    # A node (re)joining a cluster loads the registry from its peers
+    if server.cluster is not None and not args.handoff:
+        server.sync_registry()
+
+    # SIGUSR1 starts a profiling session, or stops it and dumps the stats per opcode
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, server.profiler.toggle)
+
+    # SIGHUP re-reads the config file and applies the hot-reloadable parameters
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, server.request_reload)
+
+    # SIGUSR2 hands the listening socket and state over to a freshly started process
+    if hasattr(signal, 'SIGUSR2'):
+        signal.signal(signal.SIGUSR2, server.request_upgrade)
+
     server.start()
 
 
@@ -1,9 +1,179 @@
 import os
 import logging
+import configparser
 from pathlib import Path
+from typing import Dict, List, Optional
+
+
+def _parse_bool(value: str) -> bool:
+    """Parse a boolean config value such as 'true', 'yes', 'on' or '1'"""
+    lowered = value.strip().lower()
+    if lowered in ('1', 'true', 'yes', 'on'):
+        return True
+    if lowered in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(f"Invalid boolean value: {value}")
+
 
 class ServerConfig:
     DEFAULT_PORT = 1357
+    CONFIG_FILE = "server.conf"
+    CONFIG_SECTION = "server"
+    ENV_PREFIX = "MESSAGEU_"
+
+    # Tuning parameters: name -> (type, hot reloadable on SIGHUP)
+    PARAMETERS = {
+        'bind_address': (str, False),
+        'port': (int, False),
+        'backlog': (int, False),
+        'rcvbuf': (int, True),
+        'sndbuf': (int, True),
+        'tcp_nodelay': (bool, True),
+        'max_workers': (int, False),
+        'max_payload_size': (int, True),
+        'client_timeout': (float, True),
+        'drain_timeout': (float, True),
+        'log_level': (str, True),
+        'admin_opcodes': (bool, True),
+        'profile_dir': (str, True),
+        'slow_request_ms': (float, True),
+        'spool_dir': (str, False),
+        'upload_chunk_size': (int, True),
+        'upload_timeout': (float, True),
+        'dedupe_entries': (int, True),
+        'dedupe_ttl': (float, True),
+        'capture_file': (str, True),
+        'capture_redact': (str, True),
+        'cluster_nodes': (str, False),
+        'cluster_node_id': (str, False),
+    }
+
+    def __init__(self):
+        """Initialize a configuration holding the default values"""
+        self.bind_address: str = '127.0.0.1'
+        self.port: int = ServerConfig.DEFAULT_PORT  # Read from myport.info unless configured
+        self.backlog: int = 128
+        self.rcvbuf: int = 0  # SO_RCVBUF for client sockets, 0 keeps the OS default
+        self.sndbuf: int = 0  # SO_SNDBUF for client sockets, 0 keeps the OS default
+        self.tcp_nodelay: bool = True
+        self.max_workers: int = 0  # 0 handles each connection in its own thread
+        self.max_payload_size: int = 16 * 1024 * 1024
+        self.client_timeout: float = 30.0  # Seconds, 0 disables the timeout
+        self.drain_timeout: float = 10.0  # Seconds an upgrade waits for in-flight requests
+        self.log_level: str = 'INFO'
+        self.admin_opcodes: bool = False  # Accept admin requests (code 700) from loopback
+        self.profile_dir: str = 'profiles'  # Relative to the server code directory
+        self.slow_request_ms: float = 0.0  # Log phase timings of slower requests, 0 disables
+        self.spool_dir: str = 'spool'  # Uploaded contents, relative to the server code directory
+        self.upload_chunk_size: int = 1024 * 1024
+        self.upload_timeout: float = 3600.0  # Seconds an unfinished upload is kept without new chunks
+        self.dedupe_entries: int = 1024  # Idempotency keys remembered per sender for code 609
+        self.dedupe_ttl: float = 600.0  # Seconds an idempotency key is remembered
+        self.capture_file: str = ''  # Trace file of the handled requests, relative to the server code directory
+        self.capture_redact: str = 'none'  # Message contents in the trace: none (kept), zero or random
+        self.cluster_nodes: str = ''  # "name=host:port,..." for every node, empty runs standalone
+        self.cluster_node_id: str = ''  # Name of this node in cluster_nodes
+        self.source: Optional[Path] = None
+
+    @staticmethod
+    def config_path() -> Path:
+        """
+        Path of the config file: $MESSAGEU_CONFIG if set, otherwise server.conf
+        next to the server code
+        """
+        override = os.environ.get(ServerConfig.ENV_PREFIX + 'CONFIG')
+        if override:
+            return Path(override)
+        return Path(__file__).parent / ServerConfig.CONFIG_FILE
+
+    @classmethod
+    def load(cls, path: Optional[Path] = None) -> 'ServerConfig':
+        """
+        Load configuration from the config file, then apply environment overrides
+        (MESSAGEU_<NAME>, e.g. MESSAGEU_BACKLOG=512).
+        Missing file or invalid values fall back to the defaults.
+
+        Args:
+            path: Config file to read (optional, defaults to config_path())
+
+        Returns:
+            ServerConfig: The loaded configuration
+        """
+        config = cls()
+        config.source = path or cls.config_path()
+
+        values: Dict[str, str] = {}
+        parser = configparser.ConfigParser()
+        try:
+            if parser.read(config.source) and parser.has_section(cls.CONFIG_SECTION):
+                values.update(parser.items(cls.CONFIG_SECTION))
+        except configparser.Error as e:
+            logging.warning(f"Error reading config file {config.source}: {e}. Using defaults")
+
+        for name in cls.PARAMETERS:
+            env_value = os.environ.get(cls.ENV_PREFIX + name.upper())
+            if env_value is not None:
+                values[name] = env_value
+
+        if 'port' not in values or not values['port'].strip():
+            config.port = cls.read_port()
+
+        for name, raw in values.items():
+            if name not in cls.PARAMETERS:
+                logging.warning(f"Unknown config parameter: {name}")
+                continue
+            try:
+                setattr(config, name, cls._convert(name, raw))
+            except ValueError as e:
+                logging.warning(f"Invalid value for {name}: {e}. Using default {getattr(config, name)}")
+
+        # A chunk of the advertised size must fit in a 606 request with its 8 bytes upload ID and offset
+        if config.upload_chunk_size + 8 > config.max_payload_size:
+            chunk_size = max(config.max_payload_size - 8, 1)
+            logging.warning(f"upload_chunk_size {config.upload_chunk_size} does not fit in max_payload_size "
+                            f"{config.max_payload_size}. Using {chunk_size}")
+            config.upload_chunk_size = chunk_size
+
+        return config
+
+    @classmethod
+    def _convert(cls, name: str, raw: str):
+        """Convert and validate a raw string value for the given parameter"""
+        value_type = cls.PARAMETERS[name][0]
+        if value_type is bool:
+            return _parse_bool(raw)
+
+        value = value_type(raw.strip())
+        if name == 'port' and not 1 <= value <= 65535:
+            raise ValueError(f"Port {value} out of valid range (1-65535)")
+        if name == 'log_level':
+            value = value.upper()
+            if not isinstance(logging.getLevelName(value), int):
+                raise ValueError(f"Unknown log level {value}")
+        if value_type in (int, float) and value < 0:
+            raise ValueError(f"{name} must not be negative")
+        return value
+
+    def reload(self) -> List[str]:
+        """
+        Re-read the configuration and apply the hot-reloadable parameters.
+        Changes to other parameters are logged and ignored until restart.
+
+        Returns:
+            list: Names of the parameters that changed
+        """
+        fresh = ServerConfig.load(self.source)
+        changed = []
+        for name, (_, hot) in self.PARAMETERS.items():
+            new_value = getattr(fresh, name)
+            if getattr(self, name) == new_value:
+                continue
+            if hot:
+                setattr(self, name, new_value)
+                changed.append(name)
+            else:
+                logging.warning(f"Config parameter {name} cannot be changed without a restart")
+        return changed
 
     @staticmethod
     def read_port() -> int:
@@ -40,4 +210,4 @@ class ServerConfig:
 
         except Exception as e:
             logging.warning(f"Error reading port file: {e}. Using default port {ServerConfig.DEFAULT_PORT}")
-            return ServerConfig.DEFAULT_PORT
\ No newline at end of file
+            return ServerConfig.DEFAULT_PORT
@@ -0,0 +1,318 @@
+# src/server/upgrade.py
+
+import io
+import os
+import socket
+import struct
+import logging
+import time
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Tuple
+
+from user import User
+from message import Message, SharedContent
+from upload import UploadSession
+from group import Group
+from dedupe import DedupeTable
+from presence import PresenceIndex
+
+SNAPSHOT_MAGIC = b'MUSS'
+# Version 1 lacks the in file flag and the uploads section, version 2 the shared contents and groups,
+# version 3 the next message ID and the idempotency keys, version 4 the client activity
+SNAPSHOT_VERSION = 5
+
+# Handoff message announcing a snapshot streamed in sections instead of preceded by its size
+STREAMED_SNAPSHOT = 0xFFFFFFFF
+STREAM_BUFFER_SIZE = 1 << 20
+
+# Where a message content is stored
+CONTENT_INLINE = 0
+CONTENT_FILE = 1
+CONTENT_SHARED = 2
+
+
+def handoff_supported() -> bool:
+    """Check whether the platform can pass file descriptors over Unix sockets"""
+    return hasattr(socket, 'AF_UNIX') and hasattr(socket, 'send_fds')
+
+
+def make_handoff_path() -> str:
+    """Return a fresh path for the handoff Unix domain socket"""
+    return os.path.join(tempfile.mkdtemp(prefix='messageu-'), 'handoff.sock')
+
+
+def write_snapshot(out: BinaryIO, clients: Dict[bytes, User], messages: List[Message],
+                   uploads: Dict[int, UploadSession], groups: Dict[bytes, Group], next_message_id: int,
+                   sent_nonces: DedupeTable, presence: PresenceIndex):
+    """
+    Write the server registry, pending messages, unfinished uploads, groups, the next message ID,
+    the idempotency keys of sent messages and the client activity section by section,
+    contents are not copied
+
+    Layout (little endian):
+        magic (4 bytes), version (1 byte), client count (4 bytes)
+        per client: ID (16 bytes), username length (1 byte), username, public key (160 bytes)
+        shared content count (4 bytes)
+        per shared content: size (4 bytes), content
+        message count (4 bytes)
+        per message: ID (4 bytes), to (16 bytes), from (16 bytes), type (1 byte),
+                     content storage (1 byte), size (4 bytes),
+                     content, spool file path or shared content index (4 bytes)
+        upload count (4 bytes)
+        per upload: ID (4 bytes), owner (16 bytes), to (16 bytes), type (1 byte),
+                    total size (4 bytes), received (4 bytes), path length (2 bytes), spool file path
+        group count (4 bytes)
+        per group: ID (16 bytes), name length (1 byte), name, owner (16 bytes),
+                   member count (4 bytes), member IDs (16 bytes each)
+        next message ID (4 bytes), sender count (4 bytes)
+        per sender: ID (16 bytes), key count (4 bytes)
+        per key, oldest first: nonce (16 bytes), destination (16 bytes), message ID (4 bytes),
+                               seconds since recorded (8 bytes, double)
+        active client count (4 bytes)
+        per client, least recently active first: ID (16 bytes), seconds since last activity (8 bytes, double)
+
+    Args:
+        out: Buffered binary stream, e.g. a socket file or io.BytesIO
+    """
+    out.write(SNAPSHOT_MAGIC)
+    out.write(struct.pack('<BI', SNAPSHOT_VERSION, len(clients)))
+    for user in clients.values():
+        username = user.username.encode('ascii')
+        out.write(user.ID)
+        out.write(struct.pack('<B', len(username)))
+        out.write(username)
+        out.write(user.public_key)
+
+    # Contents shared by several messages are stored once
+    shared_index: Dict[int, int] = {}
+    shared_contents: List[SharedContent] = []
+    for msg in messages:
+        if msg.shared is not None and id(msg.shared) not in shared_index:
+            shared_index[id(msg.shared)] = len(shared_contents)
+            shared_contents.append(msg.shared)
+
+    out.write(struct.pack('<I', len(shared_contents)))
+    for shared in shared_contents:
+        out.write(struct.pack('<I', len(shared.data)))
+        out.write(shared.data)
+
+    out.write(struct.pack('<I', len(messages)))
+    for msg in messages:
+        if msg.shared is not None:
+            storage, content = CONTENT_SHARED, struct.pack('<I', shared_index[id(msg.shared)])
+        elif msg.content_file is not None:
+            storage, content = CONTENT_FILE, os.fsencode(msg.content_file)
+        else:
+            storage, content = CONTENT_INLINE, msg.content or b''
+        out.write(struct.pack('<I16s16sBBI', msg.ID, msg.to_client, msg.from_client,
+                              msg.type, storage, len(content)))
+        out.write(content)
+
+    out.write(struct.pack('<I', len(uploads)))
+    for session in uploads.values():
+        path = os.fsencode(session.path)
+        out.write(struct.pack('<I16s16sBIIH', session.ID, session.owner, session.to_client,
+                              session.type, session.total_size, session.received, len(path)))
+        out.write(path)
+
+    out.write(struct.pack('<I', len(groups)))
+    for group in groups.values():
+        name = group.name.encode('ascii')
+        out.write(group.ID)
+        out.write(struct.pack('<B', len(name)))
+        out.write(name)
+        out.write(group.owner)
+        out.write(struct.pack('<I', len(group.members)))
+        out.write(b''.join(group.members))
+
+    # Monotonic clocks differ between processes on some platforms, keys carry their age
+    now = time.monotonic()
+    out.write(struct.pack('<II', next_message_id, len(sent_nonces.senders)))
+    for sender, entries in sent_nonces.senders.items():
+        out.write(sender)
+        out.write(struct.pack('<I', len(entries)))
+        for nonce, (dest_client_id, message_id, recorded) in entries.items():
+            out.write(struct.pack('<16s16sId', nonce, dest_client_id, message_id, now - recorded))
+
+    with presence.lock:
+        last_active = list(presence.last_active.items())
+    out.write(struct.pack('<I', len(last_active)))
+    for client_id, active in last_active:
+        out.write(struct.pack('<16sd', client_id, now - active))
+
+
+def encode_snapshot(*state) -> bytes:
+    """Snapshot of the state passed to write_snapshot as one bytes object"""
+    out = io.BytesIO()
+    write_snapshot(out, *state)
+    return out.getvalue()
+
+
+def read_exact(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) < size:
+        raise ConnectionError("Snapshot ended unexpectedly")
+    return data
+
+
+def unpack(stream: BinaryIO, layout: str) -> tuple:
+    return struct.unpack(layout, read_exact(stream, struct.calcsize(layout)))
+
+
+def read_snapshot(stream: BinaryIO) -> Tuple[Dict[bytes, User], List[Message], Dict[int, UploadSession],
+                                             Dict[bytes, Group], int, OrderedDict, OrderedDict]:
+    """
+    Rebuild the registry, pending messages, unfinished uploads, groups, the next message ID,
+    the idempotency keys and the client activity from a snapshot stream, section by section
+
+    Returns:
+        tuple: (clients dict keyed by ID, list of pending messages, uploads dict keyed by ID,
+                groups dict keyed by ID, next message ID, senders of DedupeTable,
+                last activity of PresenceIndex)
+    """
+    if read_exact(stream, 4) != SNAPSHOT_MAGIC:
+        raise ValueError("Invalid snapshot magic")
+    version, client_count = unpack(stream, '<BI')
+    if version not in (1, 2, 3, 4, SNAPSHOT_VERSION):
+        raise ValueError(f"Unsupported snapshot version: {version}")
+
+    clients: Dict[bytes, User] = {}
+    for _ in range(client_count):
+        client_id, name_len = unpack(stream, '<16sB')
+        username = read_exact(stream, name_len).decode('ascii')
+        public_key = read_exact(stream, 160)
+        clients[client_id] = User(client_id, username, public_key)
+
+    shared_contents: List[SharedContent] = []
+    if version >= 3:
+        shared_count = unpack(stream, '<I')[0]
+        for _ in range(shared_count):
+            size = unpack(stream, '<I')[0]
+            # Reference counts are rebuilt from the messages below
+            shared_contents.append(SharedContent(read_exact(stream, size), 0))
+
+    message_count = unpack(stream, '<I')[0]
+
+    messages: List[Message] = []
+    for _ in range(message_count):
+        if version == 1:
+            message_id, to_client, from_client, msg_type, size = unpack(stream, '<I16s16sBI')
+            storage = CONTENT_INLINE
+        else:
+            message_id, to_client, from_client, msg_type, storage, size = unpack(stream, '<I16s16sBBI')
+        content = read_exact(stream, size)
+        if storage == CONTENT_SHARED:
+            shared = shared_contents[struct.unpack('<I', content)[0]]
+            shared.refs += 1
+            messages.append(Message(message_id, to_client, from_client, msg_type, shared=shared))
+        elif storage == CONTENT_FILE:
+            messages.append(Message(message_id, to_client, from_client, msg_type,
+                                    content_file=os.fsdecode(content)))
+        else:
+            messages.append(Message(message_id, to_client, from_client, msg_type, content or None))
+
+    uploads: Dict[int, UploadSession] = {}
+    groups: Dict[bytes, Group] = {}
+    # Older snapshots continue after the highest pending message and lack the idempotency keys
+    next_message_id = max((msg.ID for msg in messages), default=0) % 0xFFFFFFFF + 1
+    senders: OrderedDict = OrderedDict()
+    last_active: OrderedDict = OrderedDict()
+    if version == 1:
+        return clients, messages, uploads, groups, next_message_id, senders, last_active
+
+    upload_count = unpack(stream, '<I')[0]
+    for _ in range(upload_count):
+        upload_id, owner, to_client, msg_type, total_size, received, path_len = unpack(stream, '<I16s16sBIIH')
+        path = Path(os.fsdecode(read_exact(stream, path_len)))
+        uploads[upload_id] = UploadSession(upload_id, owner, to_client, msg_type, total_size, path, received)
+
+    if version == 2:
+        return clients, messages, uploads, groups, next_message_id, senders, last_active
+
+    group_count = unpack(stream, '<I')[0]
+    for _ in range(group_count):
+        group_id, name_len = unpack(stream, '<16sB')
+        name = read_exact(stream, name_len).decode('ascii')
+        owner, member_count = unpack(stream, '<16sI')
+        members = read_exact(stream, member_count * 16)
+        group = Group(group_id, name, owner)
+        group.members = {members[i * 16:(i + 1) * 16] for i in range(member_count)}
+        groups[group_id] = group
+
+    if version == 3:
+        return clients, messages, uploads, groups, next_message_id, senders, last_active
+
+    next_message_id, sender_count = unpack(stream, '<II')
+    now = time.monotonic()
+    for _ in range(sender_count):
+        sender, key_count = unpack(stream, '<16sI')
+        entries = OrderedDict()
+        for _ in range(key_count):
+            nonce, dest_client_id, message_id, age = unpack(stream, '<16s16sId')
+            entries[nonce] = (dest_client_id, message_id, now - age)
+        senders[sender] = entries
+
+    if version == 4:
+        return clients, messages, uploads, groups, next_message_id, senders, last_active
+
+    active_count = unpack(stream, '<I')[0]
+    for _ in range(active_count):
+        client_id, idle_seconds = unpack(stream, '<16sd')
+        last_active[client_id] = now - idle_seconds
+
+    return clients, messages, uploads, groups, next_message_id, senders, last_active
+
+
+def decode_snapshot(data: bytes) -> tuple:
+    """State of a snapshot held in one bytes object, see read_snapshot"""
+    return read_snapshot(io.BytesIO(data))
+
+
+def send_handoff(conn: socket.socket, listen_socket: socket.socket, *state):
+    """
+    Pass the listening socket and the state to the new server process
+    The snapshot is written to the connection section by section, so it is never held in memory
+    as a whole and its size is not limited
+
+    Args:
+        conn: Connected Unix domain socket to the new process
+        listen_socket: The listening socket to hand over
+        state: Server state as passed to write_snapshot
+    """
+    socket.send_fds(conn, [struct.pack('<I', STREAMED_SNAPSHOT)], [listen_socket.fileno()])
+    with conn.makefile('wb', buffering=STREAM_BUFFER_SIZE) as out:
+        write_snapshot(out, *state)
+
+
+def receive_handoff(path: str) -> Tuple[socket.socket, tuple]:
+    """
+    Connect to the old server process and receive its listening socket and state
+
+    Args:
+        path: Path of the Unix domain socket the old process listens on
+
+    Returns:
+        tuple: (inherited listening socket, state as returned by read_snapshot)
+    """
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+        msg, fds, _, _ = socket.recv_fds(conn, 4, 1)
+        if len(msg) != 4 or len(fds) != 1:
+            raise ConnectionError("Incomplete handoff message")
+
+        listen_socket = socket.socket(fileno=fds[0])
+        size = struct.unpack('<I', msg)[0]
+        with conn.makefile('rb', buffering=STREAM_BUFFER_SIZE) as stream:
+            if size == STREAMED_SNAPSHOT:
+                state = read_snapshot(stream)
+            else:
+                # Processes started before streaming send the snapshot size first
+                state = read_snapshot(io.BytesIO(read_exact(stream, size)))
+
+        logging.info("Received listening socket and snapshot")
+        return listen_socket, state
+    finally:
+        conn.close()
@@ -0,0 +1,73 @@
+# src/server/upload.py
+
+import os
+import time
+import threading
+from pathlib import Path
+
+
+class UploadSession:
+    def __init__(self, ID: int, owner: bytes, to_client: bytes, msg_type: int,
+                 total_size: int, path: Path, received: int = 0):
+        """
+        Initialize a chunked upload of a message content into a spool file
+        Args:
+            ID (int): 4 bytes upload identifier
+            owner (bytes): 16 bytes identifier of the uploading client
+            to_client (bytes): 16 bytes recipient identifier
+            msg_type (int): 1 byte message type of the resulting message
+            total_size (int): Announced content size in bytes
+            path (Path): Spool file receiving the chunks
+            received (int): Bytes already written to the spool file
+        """
+        if ID < 0 or ID > 0xFFFFFFFF:
+            raise ValueError("ID must be a 4 byte unsigned integer")
+        if len(owner) != 16:
+            raise ValueError("owner must be 16 bytes")
+        if len(to_client) != 16:
+            raise ValueError("to_client must be 16 bytes")
+
+        self.ID = ID
+        self.owner = owner
+        self.to_client = to_client
+        self.type = msg_type
+        self.total_size = total_size
+        self.path = path
+        self.received = received
+        self.last_activity = time.monotonic()
+        self.lock = threading.Lock()  # Serializes chunks of this upload only
+
+    def write_chunk(self, offset: int, data: bytes):
+        """
+        Append a chunk to the spool file
+        Args:
+            offset (int): Position of the chunk in the content, must equal the received size
+            data (bytes): Chunk content
+        """
+        with self.lock:
+            if offset != self.received:
+                raise ValueError(f"Chunk offset {offset} does not match received size {self.received}")
+            if self.received + len(data) > self.total_size:
+                raise ValueError(f"Chunk exceeds announced size {self.total_size}")
+
+            with open(self.path, 'ab') as f:
+                f.write(data)
+            self.received += len(data)
+            self.last_activity = time.monotonic()
+
+    def is_complete(self) -> bool:
+        """Check whether the whole announced content was received"""
+        return self.received == self.total_size
+
+    def idle_time(self) -> float:
+        """Seconds since the last chunk"""
+        return time.monotonic() - self.last_activity
+
+    def discard(self):
+        """Delete the spool file of an abandoned upload"""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def __str__(self):
+        """String representation of the upload"""
+        return f"Upload(ID={self.ID}, received={self.received}/{self.total_size})"
@@ -0,0 +1,91 @@
+# src/tests/test_capture.py
+
+import os
+import sys
+import time
+import socket
+import tempfile
+import subprocess
+from pathlib import Path
+
+# The client package lives next to the tests, the replay tool with the benchmarks
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'benchmarks'))
+
+from client import MessageUClient  # noqa: E402
+from replay import Replay  # noqa: E402
+from capture import CONTENT_OFFSETS, read_trace  # noqa: E402
+
+SERVER = Path(__file__).parent.parent / 'server' / 'server.py'
+SECRET = b'secret content '
+
+
+def start_server(port, **config):
+    """Start a server process with MESSAGEU_<NAME> overrides and wait until it accepts connections"""
+    env = dict(os.environ, MESSAGEU_PORT=str(port), MESSAGEU_LOG_LEVEL='WARNING')
+    env.update({f"MESSAGEU_{name.upper()}": str(value) for name, value in config.items()})
+    process = subprocess.Popen([sys.executable, str(SERVER)], env=env)
+    deadline = time.time() + 10
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return process
+        except ConnectionRefusedError:
+            if time.time() > deadline:
+                process.kill()
+                raise
+            time.sleep(0.1)
+
+
+def record_trace(path, port=5024):
+    """Send requests carrying message contents to a server capturing with random redaction"""
+    process = start_server(port, capture_file=path, capture_redact='random')
+    suffix = str(int(time.time()))
+    try:
+        with MessageUClient('127.0.0.1', port) as alice, MessageUClient('127.0.0.1', port) as bob:
+            alice.register(f"alice-{suffix}", b'\x01' * 160)
+            bob.register(f"bob-{suffix}", b'\x02' * 160)
+            alice.send_message(bob.client_id, 3, SECRET * 10)
+            alice.send_message_idempotent(bob.client_id, 3, SECRET * 20)
+            group_id = alice.create_group(f"group-{suffix}")
+            alice.add_member(group_id, bob.client_id)
+            alice.send_to_group(group_id, 3, SECRET * 30)
+            alice.clients_list()
+            bob.pending_messages()
+        # Requests are recorded after their response was sent
+        time.sleep(0.5)
+    finally:
+        process.terminate()
+        process.wait()
+    return {603: len(SECRET) * 10, 609: len(SECRET) * 20, 613: len(SECRET) * 30}
+
+
+def simulate_capture():
+    path = Path(tempfile.mkdtemp(prefix='messageu-')) / 'trace.bin'
+    content_sizes = record_trace(path)
+
+    requests = list(read_trace(path))
+    print(f"Recorded {len(requests)} requests, codes {[request.code for request in requests]}")
+    for request in requests:
+        if request.code in CONTENT_OFFSETS:
+            content = request.payload[CONTENT_OFFSETS[request.code]:]
+            header_size = int.from_bytes(request.header[19:23], 'little')
+            print(f"{request.code}: content size {len(content)} (sent {content_sizes[request.code]}), "
+                  f"payload size matches header: {len(request.payload) == header_size}, "
+                  f"content absent: {SECRET not in request.payload}")
+
+    process = start_server(5025)
+    try:
+        for attempt in ('fresh server', 'same server again'):
+            # Registrations fail the second time, the requests using their IDs must not wait for them
+            report = Replay(requests, '127.0.0.1', 5025, speed=0, concurrency=8).run()
+            print(f"Replay on the {attempt}: {report['requests']} requests in {report['elapsed_s']:.2f} s, "
+                  f"{report['errors']} errors, {report['mismatches']} mismatches")
+    finally:
+        process.terminate()
+        process.wait()
+        path.unlink()
+
+
+if __name__ == "__main__":
+    simulate_capture()
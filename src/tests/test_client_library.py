@@ -0,0 +1,61 @@
+# src/tests/test_client_library.py
+
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+# The client package lives next to the tests
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from client import MessageUClient, AsyncMessageUClient  # noqa: E402
+from client import protocol  # noqa: E402
+
+
+def simulate_client():
+    suffix = str(int(time.time()))
+    public_key = b'\x01' * 160
+
+    with MessageUClient('127.0.0.1', 5000) as alice, MessageUClient('127.0.0.1', 5000) as bob:
+        alice.register(f"alice-{suffix}", public_key)
+        bob.register(f"bob-{suffix}", public_key)
+        print(f"Registered alice {alice.client_id.hex()} and bob {bob.client_id.hex()}")
+
+        print(f"Alice sees {len(alice.clients_list())} other clients")
+        print(f"Bob's public key matches: {alice.public_key(bob.client_id) == public_key}")
+
+        # Pipeline 100 messages on one connection
+        pipeline = alice.pipeline()
+        for i in range(100):
+            pipeline.add(protocol.send_message(bob.client_id, 3, f"message {i}".encode('ascii')))
+        start = time.perf_counter()
+        message_ids = pipeline.execute()
+        elapsed = time.perf_counter() - start
+        print(f"Pipelined {len(message_ids)} messages in {elapsed * 1000:.1f}ms")
+
+        file_id = alice.send_file(bob.client_id, b'x' * 3_000_000)
+        print(f"Uploaded file as message {file_id}")
+
+        messages = bob.pending_messages()
+        print(f"Bob received {len(messages)} messages, last content size {len(messages[-1].content)}")
+
+    asyncio.run(simulate_async_client(suffix, public_key))
+
+
+async def simulate_async_client(suffix, public_key):
+    async with AsyncMessageUClient('127.0.0.1', 5000) as carol:
+        await carol.register(f"carol-{suffix}", public_key)
+        clients = await carol.clients_list()
+        print(f"\nAsync client carol sees {len(clients)} other clients")
+
+        # Concurrent requests use separate pooled connections
+        results = await asyncio.gather(*(carol.send_message(carol.client_id, 3, b'note to self')
+                                         for _ in range(10)))
+        print(f"Sent {len(results)} messages concurrently")
+
+        messages = await carol.pending_messages()
+        print(f"Carol received {len(messages)} messages")
+
+
+if __name__ == "__main__":
+    simulate_client()
@@ -0,0 +1,135 @@
+# src/tests/test_cluster.py
+
+import os
+import sys
+import time
+import socket
+import struct
+import subprocess
+from pathlib import Path
+
+NODES = {'node1': 5001, 'node2': 5002, 'node3': 5003}
+SERVER = Path(__file__).parent.parent / 'server' / 'server.py'
+
+
+def send_request(port, client_id, code, payload):
+    """Send one request to the node on the given port and return (code, payload) of the response"""
+    client = socket.create_connection(('127.0.0.1', port))
+    try:
+        request = bytearray()
+        request.extend(client_id)
+        request.append(1)
+        request.extend(code.to_bytes(2, 'little'))
+        request.extend(len(payload).to_bytes(4, 'little'))
+        request.extend(payload)
+        client.sendall(request)
+
+        # Get response header
+        response = bytearray()
+        while len(response) < 7:
+            chunk = client.recv(7 - len(response))
+            if not chunk:
+                raise ConnectionError("Connection closed by server")
+            response.extend(chunk)
+        version, response_code, payload_size = struct.unpack('<BHI', response)
+
+        response_payload = bytearray()
+        while len(response_payload) < payload_size:
+            chunk = client.recv(min(4096, payload_size - len(response_payload)))
+            if not chunk:
+                raise ConnectionError("Connection closed by server while receiving payload")
+            response_payload.extend(chunk)
+
+        return response_code, bytes(response_payload)
+    finally:
+        client.close()
+
+
+def start_nodes():
+    """Start one server process per node, all on localhost"""
+    spec = ','.join(f"{name}=127.0.0.1:{port}" for name, port in NODES.items())
+    processes = []
+    for name, port in NODES.items():
+        env = dict(os.environ, MESSAGEU_PORT=str(port), MESSAGEU_CLUSTER_NODES=spec,
+                   MESSAGEU_CLUSTER_NODE_ID=name, MESSAGEU_LOG_LEVEL='WARNING')
+        processes.append(subprocess.Popen([sys.executable, str(SERVER)], env=env))
+
+    # Wait until every node accepts connections
+    for port in NODES.values():
+        deadline = time.time() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port)).close()
+                break
+            except ConnectionRefusedError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
+    return processes
+
+
+def simulate_cluster():
+    processes = start_nodes()
+    try:
+        # Register one user on each node
+        ids = {}
+        for name, port in NODES.items():
+            username = f"user-{name}".encode('ascii') + b'\x00'
+            payload = username.ljust(255, b'\x00') + b'\x01' * 160
+            code, response = send_request(port, b'\x00' * 16, 600, payload)
+            if code != 2100:
+                raise ValueError(f"Registration on {name} failed, response code: {code}")
+            ids[name] = response
+            print(f"Registered user-{name} on {name}: {response.hex()}")
+
+        # A taken username is refused whichever node the registration reaches
+        for name, port in NODES.items():
+            payload = b'user-node1'.ljust(255, b'\x00') + b'\x01' * 160
+            code, _ = send_request(port, b'\x00' * 16, 600, payload)
+            print(f"Registering user-node1 again on {name}, response code: {code}")
+
+        # Every node answers the clients list from the replicated registry
+        for name, port in NODES.items():
+            code, response = send_request(port, ids['node1'], 601, b'')
+            print(f"{name} lists {len(response) // 271} other clients")
+
+        # Send from node1 to every user, then fetch each mailbox through node3
+        for name in NODES:
+            payload = ids[name] + bytes([3]) + struct.pack('<I', 5) + b'hello'
+            code, response = send_request(NODES['node1'], ids['node1'], 603, payload)
+            print(f"Send to user-{name} through node1, response code: {code}")
+
+        for name in NODES:
+            code, response = send_request(NODES['node3'], ids[name], 604, b'')
+            print(f"Fetched mailbox of user-{name} through node3: code {code}, "
+                  f"{len(response)} bytes, content {response[25:]}")
+
+        # The mailbox was removed on its node once node3 relayed it
+        code, response = send_request(NODES['node2'], ids['node1'], 604, b'')
+        print(f"Fetched mailbox of user-node1 again through node2: code {code}, {len(response)} bytes")
+
+        # A group message reports the members on an unreachable node instead of failing for all
+        members = []
+        for i in range(6):
+            payload = f"group-member{i}".encode('ascii').ljust(255, b'\x00') + b'\x01' * 160
+            members.append(send_request(NODES['node1'], b'\x00' * 16, 600, payload)[1])
+        code, group_id = send_request(NODES['node1'], ids['node1'], 610, b'group'.ljust(255, b'\x00'))
+        for member in members:
+            send_request(NODES['node1'], ids['node1'], 611, group_id + member)
+        processes[2].terminate()
+        processes[2].wait()
+        payload = group_id + bytes([3]) + struct.pack('<I', 5) + b'hello'
+        code, response = send_request(NODES['node1'], ids['node1'], 613, payload)
+        delivered = struct.unpack('<I', response[16:20])[0]
+        print(f"Group message with node3 stopped: code {code}, delivered to {delivered} of {len(members)}, "
+              f"{(len(response) - 20) // 16} members unreachable")
+
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+        print("\nCluster stopped")
+
+
+if __name__ == "__main__":
+    simulate_cluster()
@@ -0,0 +1,83 @@
+# src/tests/test_groups.py
+
+import sys
+import time
+from pathlib import Path
+
+# The client package lives next to the tests
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from client import MessageUClient, protocol  # noqa: E402
+
+# The in-process handler harness lives with the benchmarks
+sys.path.insert(0, str(Path(__file__).parent.parent / 'benchmarks'))
+
+from bench_handlers import FakeSocket, add_users, new_server  # noqa: E402
+
+
+def simulate_client(port=5000):
+    suffix = str(int(time.time()))
+    public_key = b'\x01' * 160
+
+    owner = MessageUClient('127.0.0.1', port)
+    members = [MessageUClient('127.0.0.1', port) for _ in range(3)]
+    try:
+        owner.register(f"owner-{suffix}", public_key)
+        for i, member in enumerate(members):
+            member.register(f"member{i}-{suffix}", public_key)
+
+        group_id = owner.create_group(f"group-{suffix}")
+        print(f"Created group {group_id.hex()}")
+
+        for member in members:
+            count = owner.add_member(group_id, member.client_id)
+        print(f"Group has {count} members")
+
+        # The last member leaves the group
+        count = members[-1].remove_member(group_id, members[-1].client_id)
+        print(f"Group has {count} members after one left")
+
+        content = b'f' * 1_000_000
+        recipients, undelivered = owner.send_to_group(group_id, 4, content)
+        print(f"Sent file to {recipients} recipients, {len(undelivered)} unreachable")
+
+        for i, member in enumerate(members):
+            messages = member.pending_messages()
+            received = [len(msg.content) for msg in messages]
+            print(f"member{i} received {len(messages)} messages, content sizes {received}")
+
+    finally:
+        owner.close()
+        for member in members:
+            member.close()
+
+
+def shared_content_lifetime():
+    """Check in-process that a group message is stored once and freed after the last member fetched it"""
+    server = new_server()
+    owner, first, second = add_users(server, 3)
+    fake_socket = FakeSocket()
+
+    def request(client_id, built):
+        fake_socket.load(built.encode(client_id))
+        server.handle_request(fake_socket, server.recv_exact(fake_socket, 23), first=True)
+        payload = fake_socket.sent_bytes()[protocol.RESPONSE_HEADER.size:]
+        return built.result(fake_socket.response_code(), payload)
+
+    group_id = request(owner, protocol.create_group('lifetime'))
+    request(owner, protocol.add_member(group_id, first))
+    request(owner, protocol.add_member(group_id, second))
+    recipients, _ = request(owner, protocol.send_to_group(group_id, 3, b's' * 1000))
+
+    shared = server.messages[-1].shared
+    print(f"Sent to {recipients} recipients, one shared content: "
+          f"{all(msg.shared is shared for msg in server.messages)}, references: {shared.refs}")
+    for name, member in (('first', first), ('second', second)):
+        messages = request(member, protocol.pending_messages())
+        print(f"{name} member fetched {len(messages[0].content)} bytes, references: {shared.refs}, "
+              f"content freed: {shared.data is None}")
+
+
+if __name__ == "__main__":
+    shared_content_lifetime()
+    simulate_client(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
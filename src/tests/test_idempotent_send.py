@@ -0,0 +1,45 @@
+# src/tests/test_idempotent_send.py
+
+import sys
+import time
+from pathlib import Path
+
+# The client package lives next to the tests
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from client import MessageUClient, protocol  # noqa: E402
+
+
+def simulate_client(port=5000):
+    suffix = str(int(time.time()))
+    public_key = b'\x01' * 160
+
+    sender = MessageUClient('127.0.0.1', port)
+    recipient = MessageUClient('127.0.0.1', port)
+    try:
+        sender.register(f"sender-{suffix}", public_key)
+        recipient.register(f"recipient-{suffix}", public_key)
+
+        # The same request sent three times, as a client retrying after lost responses would
+        request = protocol.send_message_idempotent(recipient.client_id, 3, b'hello once')
+        message_ids = [sender.call(request) for _ in range(3)]
+        print(f"Message IDs of the retries: {message_ids}")
+
+        # A new key is a new message
+        other_id = sender.send_message_idempotent(recipient.client_id, 3, b'hello twice')
+        print(f"Message ID of a new key: {other_id}")
+
+        messages = recipient.pending_messages()
+        print(f"Recipient received {len(messages)} messages: {[msg.content for msg in messages]}")
+
+        # A retry after the message was fetched still returns the original ID
+        print(f"Message ID of a late retry: {sender.call(request)}")
+        print(f"Recipient received {len(recipient.pending_messages())} messages after the late retry")
+
+    finally:
+        sender.close()
+        recipient.close()
+
+
+if __name__ == "__main__":
+    simulate_client(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,43 @@
+# src/tests/test_presence.py
+
+import sys
+import time
+from pathlib import Path
+
+# The client package lives next to the tests
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from client import MessageUClient  # noqa: E402
+
+
+def simulate_client(port=5000):
+    suffix = str(int(time.time()))
+    public_key = b'\x01' * 160
+
+    watcher = MessageUClient('127.0.0.1', port)
+    early = MessageUClient('127.0.0.1', port)
+    late = MessageUClient('127.0.0.1', port)
+    try:
+        watcher.register(f"watcher-{suffix}", public_key)
+        early.register(f"early-{suffix}", public_key)
+        time.sleep(3)
+        late.register(f"late-{suffix}", public_key)
+
+        names = {early.client_id: 'early', late.client_id: 'late'}
+        for window in (1, 10):
+            peers = [(names.get(client_id, client_id.hex()), idle) for client_id, idle in watcher.active_peers(window)]
+            print(f"Active within {window} seconds: {peers}")
+
+        # Any request marks a client active again
+        early.clients_list()
+        peers = [names.get(client_id, client_id.hex()) for client_id, _ in watcher.active_peers(1)]
+        print(f"Active within 1 second after a request of early: {peers}")
+
+    finally:
+        watcher.close()
+        early.close()
+        late.close()
+
+
+if __name__ == "__main__":
+    simulate_client(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
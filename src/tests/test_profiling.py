@@ -0,0 +1,106 @@
+# src/tests/test_profiling.py
+
+import os
+import sys
+import time
+import pstats
+import socket
+import struct
+import tempfile
+import subprocess
+from pathlib import Path
+
+# The client package lives next to the tests
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from client import MessageUClient  # noqa: E402
+
+SERVER = Path(__file__).parent.parent / 'server' / 'server.py'
+ACTIONS = {1: 'start profiling', 2: 'stop profiling and dump', 3: 'start tracemalloc',
+           4: 'tracemalloc report', 5: 'stop tracemalloc'}
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return
+        except ConnectionRefusedError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def admin(port, action):
+    """Send an admin request (code 700) and return (response code, report text)"""
+    with socket.create_connection(('127.0.0.1', port)) as conn:
+        conn.sendall(b'\x00' * 16 + struct.pack('<BHI', 1, 700, 1) + bytes([action]))
+        data = bytearray()
+        while True:
+            chunk = conn.recv(65536)
+            if not chunk:
+                break
+            data.extend(chunk)
+            if len(data) >= 7 and len(data) >= 7 + struct.unpack('<I', data[3:7])[0]:
+                break
+    _, code, size = struct.unpack('<BHI', data[:7])
+    return code, bytes(data[7:7 + size]).decode('utf-8', 'replace')
+
+
+def send_traffic(port, suffix):
+    with MessageUClient('127.0.0.1', port) as alice, MessageUClient('127.0.0.1', port) as bob:
+        alice.register(f"alice-{suffix}", b'\x01' * 160)
+        bob.register(f"bob-{suffix}", b'\x02' * 160)
+        for _ in range(20):
+            alice.send_message(bob.client_id, 3, b'm' * 10_000)
+        alice.clients_list()
+        bob.pending_messages()
+
+
+def simulate_profiling(port=5028):
+    profile_dir = Path(tempfile.mkdtemp(prefix='messageu-profiles-'))
+    log_path = profile_dir / 'server.log'
+    # Every request is slower than the threshold, so each one is logged with its phase timings
+    env = dict(os.environ, MESSAGEU_PORT=str(port), MESSAGEU_ADMIN_OPCODES='true',
+               MESSAGEU_SLOW_REQUEST_MS='0.001', MESSAGEU_PROFILE_DIR=str(profile_dir),
+               MESSAGEU_LOG_LEVEL='WARNING')
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen([sys.executable, str(SERVER)], env=env, stderr=log)
+    suffix = str(int(time.time()))
+    try:
+        wait_for_port(port)
+
+        code, report = admin(port, 1)
+        print(f"Action 1 ({ACTIONS[1]}): code {code}, {report.strip()}")
+        send_traffic(port, suffix)
+        code, report = admin(port, 2)
+        print(f"Action 2 ({ACTIONS[2]}): code {code}, {len(report.splitlines())} report lines")
+
+        for path in sorted(profile_dir.glob('*.pstats')):
+            calls = pstats.Stats(str(path)).total_calls
+            print(f"  {path.name.split('-')[-1]}: {calls} calls profiled")
+
+        code, report = admin(port, 3)
+        print(f"Action 3 ({ACTIONS[3]}): code {code}, {report.strip()}")
+        send_traffic(port, suffix + '-2')
+        code, report = admin(port, 4)
+        print(f"Action 4 ({ACTIONS[4]}): code {code}, {len(report.splitlines())} report lines, "
+              f"first: {report.splitlines()[0] if report else ''}")
+        code, report = admin(port, 5)
+        print(f"Action 5 ({ACTIONS[5]}): code {code}, {report.strip()}")
+
+        code, _ = admin(port, 9)
+        print(f"Unknown action answered with code {code}")
+
+    finally:
+        process.terminate()
+        process.wait()
+
+    slow = [line.split(' - ')[-1] for line in log_path.read_text().splitlines() if 'Slow request' in line]
+    sends = [line for line in slow if 'code=603' in line]
+    print(f"{len(slow)} slow request log lines, {len(sends)} for 603, e.g. {sends[0] if sends else None}")
+
+
+if __name__ == "__main__":
+    simulate_profiling(int(sys.argv[1]) if len(sys.argv) > 1 else 5028)
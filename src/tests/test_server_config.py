@@ -0,0 +1,88 @@
+# src/tests/test_server_config.py
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# The server modules import each other by name
+sys.path.insert(0, str(Path(__file__).parent.parent / 'server'))
+
+from server_config import ServerConfig  # noqa: E402
+
+
+def write_config(text):
+    """Write a config file in a fresh directory and return its path"""
+    path = Path(tempfile.mkdtemp(prefix='messageu-')) / 'server.conf'
+    path.write_text(text)
+    return path
+
+
+def clear_overrides():
+    for name in list(os.environ):
+        if name.startswith(ServerConfig.ENV_PREFIX):
+            del os.environ[name]
+
+
+def simulate_config():
+    clear_overrides()
+
+    # Values of the file, converted to their types; notes go on their own lines
+    path = write_config("[server]\n"
+                        "# Listen backlog\n"
+                        "backlog = 512\n"
+                        "tcp_nodelay = off\n"
+                        "client_timeout = 2.5\n"
+                        "log_level = debug\n"
+                        "port = 4000\n")
+    config = ServerConfig.load(path)
+    print(f"File values: backlog {config.backlog!r}, tcp_nodelay {config.tcp_nodelay!r}, "
+          f"client_timeout {config.client_timeout!r}, log_level {config.log_level!r}, port {config.port!r}")
+
+    # Environment variables override the file
+    os.environ['MESSAGEU_BACKLOG'] = '64'
+    os.environ['MESSAGEU_MAX_WORKERS'] = '8'
+    config = ServerConfig.load(path)
+    print(f"Overrides: backlog {config.backlog} (file 512), max_workers {config.max_workers}")
+    clear_overrides()
+
+    # Invalid and negative values keep the defaults, the other values still apply
+    defaults = ServerConfig()
+    path = write_config("[server]\n"
+                        "backlog = many\n"
+                        "client_timeout = -1\n"
+                        "port = 70000\n"
+                        "tcp_nodelay = maybe\n"
+                        "log_level = loud\n"
+                        "max_workers = 4\n"
+                        "backlog_size = 3\n")
+    config = ServerConfig.load(path)
+    rejected = ['backlog', 'client_timeout', 'tcp_nodelay', 'log_level']
+    print(f"Invalid values rejected: {all(getattr(config, name) == getattr(defaults, name) for name in rejected)}, "
+          f"port out of range rejected: {config.port != 70000}, valid value kept: {config.max_workers == 4}")
+
+    # A text after a value is part of the value, not a comment
+    config = ServerConfig.load(write_config("[server]\nbacklog = 256  # larger\n"))
+    print(f"Inline note rejected, default kept: {config.backlog == defaults.backlog}")
+
+    # A chunk must fit in max_payload_size with its upload ID and offset
+    config = ServerConfig.load(write_config("[server]\nmax_payload_size = 1000\nupload_chunk_size = 4096\n"))
+    print(f"Chunk size clamped: {config.upload_chunk_size} (max payload {config.max_payload_size})")
+
+    # Missing file falls back to the defaults
+    config = ServerConfig.load(Path(tempfile.mkdtemp(prefix='messageu-')) / 'missing.conf')
+    print(f"Missing file uses defaults: {config.backlog == defaults.backlog}")
+
+    # Reload applies hot parameters and keeps the others until restart
+    path = write_config("[server]\nmax_payload_size = 1048576\nupload_chunk_size = 4096\n"
+                        "log_level = INFO\nport = 4000\n")
+    config = ServerConfig.load(path)
+    path.write_text("[server]\nmax_payload_size = 2097152\nupload_chunk_size = 4096\n"
+                    "log_level = WARNING\nport = 4001\n")
+    changed = config.reload()
+    print(f"Reload changed {sorted(changed)}: max_payload_size {config.max_payload_size}, "
+          f"log_level {config.log_level}, port kept {config.port}")
+
+
+if __name__ == "__main__":
+    simulate_config()
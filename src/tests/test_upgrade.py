@@ -0,0 +1,144 @@
+# src/tests/test_upgrade.py
+
+import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+import subprocess
+import tempfile
+from pathlib import Path
+
+# The server modules import each other by name, the client package lives next to the tests
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'server'))
+
+import upgrade  # noqa: E402
+from user import User  # noqa: E402
+from message import Message, SharedContent  # noqa: E402
+from upload import UploadSession  # noqa: E402
+from group import Group  # noqa: E402
+from dedupe import DedupeTable  # noqa: E402
+from presence import PresenceIndex  # noqa: E402
+from client import MessageUClient, AsyncMessageUClient  # noqa: E402
+
+SERVER = Path(__file__).parent.parent / 'server' / 'server.py'
+
+
+def snapshot_round_trip():
+    """Encode a snapshot of every kind of state and check it decodes to the same state"""
+    alice, bob = b'a' * 16, b'b' * 16
+    clients = {alice: User(alice, 'alice', b'\x01' * 160), bob: User(bob, 'bob', b'\x02' * 160)}
+    shared = SharedContent(b'group content', 2)
+    spool_file = os.path.join(tempfile.gettempdir(), 'spooled-content')
+    messages = [
+        Message(1, bob, alice, 3, b'inline content'),
+        Message(2, bob, alice, 4, content_file=spool_file),
+        Message(3, alice, bob, 3, shared=shared),
+        Message(4, bob, alice, 3, shared=shared),
+    ]
+    uploads = {7: UploadSession(7, alice, bob, 4, 1000, Path(spool_file + '.part'), 250)}
+    group = Group(b'g' * 16, 'friends', alice)
+    group.members.add(bob)
+
+    sent_nonces = DedupeTable(16, 600)
+    sent_nonces.record(bob, b'n' * 16, alice, 2)
+
+    presence = PresenceIndex()
+    presence.touch(bob)
+    presence.touch(alice)
+
+    snapshot = upgrade.encode_snapshot(clients, messages, uploads, {group.ID: group}, 9, sent_nonces, presence)
+    clients2, messages2, uploads2, groups2, next_message_id, senders, last_active = upgrade.decode_snapshot(snapshot)
+
+    print(f"Clients restored: {sorted(user.username for user in clients2.values())}")
+    print(f"Message contents restored: {[msg.content for msg in messages2[:1] + messages2[2:]]}, "
+          f"spool file: {messages2[1].content_file == spool_file}")
+    print(f"Shared content stored once: {messages2[2].shared is messages2[3].shared}, "
+          f"references: {messages2[2].shared.refs}")
+    upload = uploads2[7]
+    print(f"Upload restored: received {upload.received} of {upload.total_size} into {upload.path.name}")
+    print(f"Group restored: {groups2[group.ID].name} with {len(groups2[group.ID].members)} members")
+    restored_nonces = DedupeTable(16, 600)
+    restored_nonces.senders = senders
+    print(f"Next message ID restored: {next_message_id}, "
+          f"idempotency key restored: {restored_nonces.get(bob, b'n' * 16) == (alice, 2)}")
+    restored_presence = PresenceIndex()
+    restored_presence.last_active = last_active
+    print(f"Activity restored, most recent first: "
+          f"{[clients2[client_id].username for client_id, _ in restored_presence.active_within(60)]}")
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return
+        except ConnectionRefusedError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def simulate_upgrade(port=5020):
+    """
+    Upgrade a running server while a connection is open without having sent a request,
+    and while pooled client connections are idle between requests
+    """
+    env = dict(os.environ, MESSAGEU_PORT=str(port), MESSAGEU_LOG_LEVEL='WARNING')
+    # The new process started by the upgrade joins the session, so both can be stopped together
+    process = subprocess.Popen([sys.executable, str(SERVER)], env=env, start_new_session=True)
+    suffix = str(int(time.time()))
+    try:
+        wait_for_port(port)
+        with MessageUClient('127.0.0.1', port) as sender, MessageUClient('127.0.0.1', port) as recipient:
+            sender.register(f"sender-{suffix}", b'\x01' * 160)
+            recipient.register(f"recipient-{suffix}", b'\x01' * 160)
+            first_id = sender.send_message(recipient.client_id, 3, b'sent before the upgrade')
+            # The snapshot is streamed to the new process, large contents are not copied into one buffer
+            sender.send_message(recipient.client_id, 3, b'l' * 8_000_000)
+
+        # Pooled connections the old process closes while they are idle
+        pooled = MessageUClient('127.0.0.1', port, client_id=recipient.client_id)
+        print(f"Pooled client sees {len(pooled.clients_list())} other clients before the upgrade")
+        loop = asyncio.new_event_loop()
+        pooled_async = AsyncMessageUClient('127.0.0.1', port, client_id=sender.client_id)
+        loop.run_until_complete(pooled_async.clients_list())
+
+        # A client that connected but has not sent anything yet must not hold up the upgrade
+        silent = socket.create_connection(('127.0.0.1', port))
+
+        start = time.time()
+        process.send_signal(signal.SIGUSR2)
+        process.wait(timeout=30)
+        print(f"Old process exited {time.time() - start:.1f} s after SIGUSR2")
+        print(f"Silent connection closed by the old process: {silent.recv(1) == b''}")
+        silent.close()
+
+        with MessageUClient('127.0.0.1', port) as late:
+            start = time.time()
+            late.register(f"late-{suffix}", b'\x01' * 160)
+            print(f"Registration on the new process took {time.time() - start:.2f} s")
+            active = {peer_id for peer_id, _ in late.active_peers(3600)}
+            print(f"Clients active before the upgrade still listed: "
+                  f"{sender.client_id in active and recipient.client_id in active}")
+
+        # Not idempotent, sent again on a new connection since the old one closed before responding
+        print(f"Messages kept across the upgrade, fetched on the pooled connection: "
+              f"{[msg.content[:30] for msg in pooled.pending_messages()]}")
+        message_id = loop.run_until_complete(pooled_async.send_message(recipient.client_id, 3, b'after'))
+        print(f"Async pooled client sent message {message_id} after the upgrade, "
+              f"first message was {first_id}")
+        pooled.close()
+        pooled_async.close()
+        loop.close()
+
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+
+
+if __name__ == "__main__":
+    snapshot_round_trip()
+    simulate_upgrade(int(sys.argv[1]) if len(sys.argv) > 1 else 5020)
@@ -0,0 +1,102 @@
+# src/tests/test_upload_file.py
+
+import socket
+import struct
+
+
+def send_request(client_id, code, payload):
+    """Send one request on a new connection and return (code, payload) of the response"""
+    client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    client.connect(('127.0.0.1', 5000))
+    try:
+        request = bytearray()
+        request.extend(client_id)
+        # Version (1 byte)
+        request.append(1)
+        # Request code (2 bytes, little endian)
+        request.extend(code.to_bytes(2, 'little'))
+        # Payload size (4 bytes, little endian)
+        request.extend(len(payload).to_bytes(4, 'little'))
+        request.extend(payload)
+        client.sendall(request)
+
+        # Get response header
+        response = bytearray()
+        while len(response) < 7:
+            chunk = client.recv(7 - len(response))
+            if not chunk:
+                raise ConnectionError("Connection closed by server")
+            response.extend(chunk)
+        version, response_code, payload_size = struct.unpack('<BHI', response)
+
+        response_payload = bytearray()
+        while len(response_payload) < payload_size:
+            chunk = client.recv(payload_size - len(response_payload))
+            if not chunk:
+                raise ConnectionError("Connection closed by server while receiving payload")
+            response_payload.extend(chunk)
+
+        return response_code, bytes(response_payload)
+    finally:
+        client.close()
+
+
+def simulate_client():
+    # Get sender ID from user input
+    print("Enter sender client ID (hex string format):")
+    sender_id = bytes.fromhex(input().strip())
+    if len(sender_id) != 16:
+        raise ValueError(f"Invalid ID length: got {len(sender_id)} bytes, expected 16")
+
+    # Get destination ID from user input
+    print("Enter destination client ID (hex string format):")
+    dest_id = bytes.fromhex(input().strip())
+    if len(dest_id) != 16:
+        raise ValueError(f"Invalid ID length: got {len(dest_id)} bytes, expected 16")
+
+    print("Enter path of the file to send:")
+    with open(input().strip(), 'rb') as f:
+        content = f.read()
+
+    # Open upload: destination ID, message type 4 (send file), total size
+    payload = dest_id + bytes([4]) + struct.pack('<I', len(content))
+    code, response = send_request(sender_id, 605, payload)
+    if code != 2105:
+        raise ValueError(f"Opening upload failed, response code: {code}")
+    upload_id, chunk_size = struct.unpack('<II', response)
+    print(f"Opened upload {upload_id}, chunk size {chunk_size}")
+
+    # Send the first half of the chunks, then resume from the offset reported by the server
+    half = len(content) // 2
+    offset = 0
+    while offset < half:
+        chunk = content[offset:offset + chunk_size]
+        code, response = send_request(sender_id, 606, struct.pack('<II', upload_id, offset) + chunk)
+        if code != 2106:
+            raise ValueError(f"Chunk at offset {offset} failed, response code: {code}")
+        offset = struct.unpack('<II', response)[1]
+        print(f"Sent chunk, received size: {offset}")
+
+    code, response = send_request(sender_id, 607, struct.pack('<I', upload_id))
+    offset = struct.unpack('<II', response)[1]
+    print(f"Resuming upload at offset {offset}")
+
+    while offset < len(content):
+        chunk = content[offset:offset + chunk_size]
+        code, response = send_request(sender_id, 606, struct.pack('<II', upload_id, offset) + chunk)
+        if code != 2106:
+            raise ValueError(f"Chunk at offset {offset} failed, response code: {code}")
+        offset = struct.unpack('<II', response)[1]
+        print(f"Sent chunk, received size: {offset}")
+
+    # Commit the upload as a message
+    code, response = send_request(sender_id, 608, struct.pack('<I', upload_id))
+    if code == 2103:
+        message_id = struct.unpack('<I', response[16:])[0]
+        print(f"\nFile sent successfully, message ID: {message_id}")
+    else:
+        print(f"Commit failed, response code: {code}")
+
+
+if __name__ == "__main__":
+    simulate_client()
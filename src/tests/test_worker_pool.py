@@ -0,0 +1,67 @@
+# src/tests/test_worker_pool.py
+
+import os
+import sys
+import time
+import socket
+import subprocess
+from pathlib import Path
+
+# The client package lives next to the tests
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from client import MessageUClient  # noqa: E402
+
+SERVER = Path(__file__).parent.parent / 'server' / 'server.py'
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return
+        except ConnectionRefusedError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def simulate_idle_connections(port=5021, workers=2):
+    """More idle persistent connections than worker threads must not block the next client"""
+    env = dict(os.environ, MESSAGEU_PORT=str(port), MESSAGEU_MAX_WORKERS=str(workers),
+               MESSAGEU_CLIENT_TIMEOUT='5', MESSAGEU_LOG_LEVEL='WARNING')
+    process = subprocess.Popen([sys.executable, str(SERVER)], env=env)
+    suffix = str(int(time.time()))
+    clients = []
+    try:
+        wait_for_port(port)
+        # Connections that never send a request do not hold a worker either
+        silent = [socket.create_connection(('127.0.0.1', port)) for _ in range(workers)]
+
+        for i in range(workers * 2):
+            client = MessageUClient('127.0.0.1', port, timeout=3)
+            client.register(f"pooled{i}-{suffix}", b'\x01' * 160)
+            clients.append(client)
+        print(f"{len(clients)} clients keep a connection open on {workers} workers")
+
+        start = time.time()
+        for client in clients:
+            client.clients_list()
+        print(f"Every client was served again on its idle connection in {time.time() - start:.2f} s")
+
+        start = time.time()
+        print(f"Silent connections closed after client_timeout: {all(s.recv(1) == b'' for s in silent)} "
+              f"({time.time() - start:.1f} s)")
+        for s in silent:
+            s.close()
+
+    finally:
+        for client in clients:
+            client.close()
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    simulate_idle_connections(int(sys.argv[1]) if len(sys.argv) > 1 else 5021)